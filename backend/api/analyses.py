@@ -4,7 +4,9 @@ import logging
 from uuid import UUID
 
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
 
+from database import AsyncSessionLocal
 from dependencies import DatabaseSession, CurrentUser
 from schemas import (
     AnalysisCreate,
@@ -13,14 +15,23 @@ from schemas import (
     AnalysisTaskStatusResponse,
     AnalysisListResponse,
 )
+from config import settings
+from models import AnalysisStatus, MessageRole, UsageFeature
+from prompts import get_chat_system_prompt
 from services.analysis_service import (
+    complete_analysis,
     create_analysis,
+    fail_analysis,
     get_analysis_by_dream_id,
     get_analysis_by_id,
     get_task_status,
     get_user_analyses,
+    prepare_analysis,
 )
 from services.dream_service import get_dream_by_id
+from services.message_service import create_message, build_llm_context
+from services.stream_service import stream_completion, sse_event
+from services.usage_service import check_token_quota, record_usage
 
 router = APIRouter(prefix="/analyses", tags=["Analyses"])
 logger = logging.getLogger(__name__)
@@ -48,6 +59,12 @@ async def create_analysis_endpoint(
             detail="Dream not found"
         )
     
+    if not await check_token_quota(db, current_user):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Daily limit of {settings.llm_tokens_per_day_limit} LLM tokens exceeded"
+        )
+    
     try:
         # Создаём анализ (или сбрасываем существующий) и запускаем задачу
         analysis, task_id = await create_analysis(db, dream, current_user)
@@ -72,10 +89,104 @@ async def create_analysis_endpoint(
         )
 
 
+@router.post("/stream")
+async def create_analysis_stream_endpoint(
+    analysis_data: AnalysisCreate,
+    current_user: CurrentUser,
+    db: DatabaseSession
+):
+    """
+    Запросить анализ сна и получить его потоком (SSE), без Celery
+    
+    - Создаёт анализ (или сбрасывает существующий)
+    - События: analysis (ID и статус), delta (фрагменты ответа),
+      done (анализ сохранён) или error
+    - Анализ сохраняется, даже если клиент отключился
+    """
+    dream = await get_dream_by_id(db, analysis_data.dream_id, current_user)
+    
+    if not dream:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dream not found"
+        )
+    
+    if not await check_token_quota(db, current_user):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Daily limit of {settings.llm_tokens_per_day_limit} LLM tokens exceeded"
+        )
+    
+    try:
+        analysis = await prepare_analysis(db, dream, current_user)
+        analysis.status = AnalysisStatus.PROCESSING.value
+        await db.commit()
+
+        await create_message(
+            db,
+            user_id=current_user.id,
+            dream_id=dream.id,
+            role=MessageRole.USER.value,
+            content=dream.content,
+        )
+
+        system_prompt = get_chat_system_prompt(current_user.self_description)
+        llm_messages = await build_llm_context(
+            db,
+            user_id=current_user.id,
+            current_dream_id=dream.id,
+            system_prompt=system_prompt,
+        )
+    
+    except Exception as e:
+        logger.error(f"Failed to start analysis stream: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create analysis"
+        )
+
+    analysis_id = analysis.id
+    generation = analysis.generation
+    user_id = current_user.id
+    dream_id = dream.id
+
+    # Сессия запроса закрывается до окончания стрима — сохраняем в своей
+    async def on_complete(result_text: str, usage: dict) -> dict:
+        from tasks import summarize_context_task
+
+        async with AsyncSessionLocal() as session:
+            saved = await complete_analysis(session, analysis_id, generation, result_text)
+            await record_usage(session, user_id, UsageFeature.ANALYSIS, usage, dream_id)
+
+        if not saved:
+            # Анализ перезапрошен во время стрима — ответ устарел
+            return {"analysis_id": str(analysis_id), "status": "superseded"}
+
+        logger.info(f"Streamed analysis {analysis_id} completed successfully")
+        summarize_context_task.delay(str(user_id))
+        return {"analysis_id": str(analysis_id), "status": AnalysisStatus.COMPLETED.value}
+
+    async def on_error(error: Exception) -> None:
+        async with AsyncSessionLocal() as session:
+            await fail_analysis(session, analysis_id, generation, f"LLM Service error: {error}")
+
+    async def events():
+        yield sse_event("analysis", {"analysis_id": str(analysis_id), "status": AnalysisStatus.PROCESSING.value})
+        async for event in stream_completion(llm_messages, user_id, on_complete, on_error):
+            yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/task/{task_id}", response_model=AnalysisTaskStatusResponse)
 async def get_task_status_endpoint(
     task_id: str,
-    current_user: CurrentUser
+    current_user: CurrentUser,
+    db: DatabaseSession
 ):
     """
     Получить статус задачи анализа по task_id
@@ -84,7 +195,7 @@ async def get_task_status_endpoint(
     - Если SUCCESS, возвращает результат
     """
     try:
-        status_dict = await get_task_status(task_id)
+        status_dict = await get_task_status(db, task_id, current_user)
         
         return {
             "task_id": task_id,
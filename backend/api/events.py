@@ -0,0 +1,103 @@
+"""WebSocket с событиями о готовности анализов и ответов чата"""
+
+import asyncio
+import logging
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
+
+from config import settings
+from database import AsyncSessionLocal
+from dependencies import verify_token
+from models import User
+from services.event_service import event_bus
+
+router = APIRouter(prefix="/events", tags=["Events"])
+logger = logging.getLogger(__name__)
+
+# Коды закрытия WebSocket (диапазон 4000–4999 — для приложений)
+WS_UNAUTHORIZED = 4401
+
+
+async def _authenticate(websocket: WebSocket) -> User | None:
+    """
+    Дождаться первого сообщения {"type": "auth", "token": "<access token>"}
+
+    Токен не передаётся в URL, чтобы не попадать в логи прокси.
+    Сессия БД нужна только на проверку и сразу закрывается.
+
+    Returns:
+        Пользователь или None, если аутентификация не удалась
+    """
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), settings.events_auth_timeout)
+    except (asyncio.TimeoutError, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get("type") != "auth":
+        return None
+
+    try:
+        payload = verify_token(str(message.get("token", "")), token_type="access")
+        user_id = UUID(payload["sub"])
+    except (HTTPException, KeyError, ValueError):
+        return None
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+async def _drain(websocket: WebSocket) -> None:
+    """Читать входящие сообщения, пока клиент не отключится"""
+    while True:
+        await websocket.receive_text()
+
+
+@router.websocket("/ws")
+async def events_websocket(websocket: WebSocket):
+    """
+    Push-уведомления о завершении фоновых задач пользователя
+
+    - Первое сообщение клиента: {"type": "auth", "token": "<access token>"}
+    - Ответ: {"type": "ready"}, затем события analysis_ready / reply_ready
+      ({task_id, dream_id, status, ...}) и {"type": "ping"} при простое
+    - При неверном токене соединение закрывается с кодом 4401
+    """
+    await websocket.accept()
+
+    user = await _authenticate(websocket)
+    if user is None:
+        await websocket.close(code=WS_UNAUTHORIZED, reason="Could not validate credentials")
+        return
+
+    await websocket.send_json({"type": "ready"})
+    logger.info(f"Events websocket opened for user {user.id}")
+
+    # Отключение клиента видно только при чтении из сокета
+    reader = asyncio.create_task(_drain(websocket))
+    events = event_bus.subscribe(user.id, timeout=settings.events_heartbeat_interval)
+    next_event: asyncio.Task | None = None
+    try:
+        while True:
+            next_event = asyncio.create_task(anext(events))
+            done, _ = await asyncio.wait({reader, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                break
+            event = next_event.result()
+            await websocket.send_json(event if event is not None else {"type": "ping"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    except Exception as e:
+        logger.error(f"Events websocket for user {user.id} failed: {e}")
+    finally:
+        # Очередь подписчика снимается в finally генератора
+        for task in (reader, next_event):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(reader, *([next_event] if next_event else []), return_exceptions=True)
+        await events.aclose()
+        logger.info(f"Events websocket closed for user {user.id}")
@@ -4,7 +4,9 @@ import logging
 from uuid import UUID
 
 from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 
+from database import AsyncSessionLocal
 from dependencies import DatabaseSession, CurrentUser
 from schemas import (
     MessageSend,
@@ -12,10 +14,14 @@ from schemas import (
     ChatMessageListResponse,
     ChatMessageTaskResponse,
 )
-from models import MessageRole
-from services.message_service import create_message, get_messages_for_dream
+from config import settings
+from models import MessageRole, UsageFeature
+from prompts import get_chat_system_prompt
+from services.message_service import create_message, get_messages_for_dream, build_llm_context
 from services.message_task_service import get_message_task_status
 from services.dream_service import get_dream_by_id
+from services.stream_service import stream_completion, sse_event
+from services.usage_service import check_token_quota, record_usage
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
 logger = logging.getLogger(__name__)
@@ -42,6 +48,12 @@ async def send_message(
             detail="Dream not found",
         )
 
+    if not await check_token_quota(db, current_user):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Daily limit of {settings.llm_tokens_per_day_limit} LLM tokens exceeded",
+        )
+
     try:
         # Сохраняем user-сообщение
         user_msg = await create_message(
@@ -73,6 +85,92 @@ async def send_message(
         )
 
 
+@router.post("/stream")
+async def send_message_stream(
+    data: MessageSend,
+    current_user: CurrentUser,
+    db: DatabaseSession,
+):
+    """
+    Отправить follow-up сообщение и получить ответ LLM потоком (SSE).
+
+    - Сохраняет user-сообщение
+    - События: user_message, delta (фрагменты ответа), done (сохранённое
+      assistant-сообщение) или error
+    - Ответ сохраняется в историю чата, даже если клиент отключился
+    """
+    dream = await get_dream_by_id(db, data.dream_id, current_user)
+    if not dream:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dream not found",
+        )
+
+    if not await check_token_quota(db, current_user):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Daily limit of {settings.llm_tokens_per_day_limit} LLM tokens exceeded",
+        )
+
+    try:
+        user_msg = await create_message(
+            db,
+            user_id=current_user.id,
+            dream_id=data.dream_id,
+            role=MessageRole.USER.value,
+            content=data.content,
+        )
+
+        system_prompt = get_chat_system_prompt(current_user.self_description)
+        llm_messages = await build_llm_context(
+            db,
+            user_id=current_user.id,
+            current_dream_id=data.dream_id,
+            system_prompt=system_prompt,
+        )
+
+    except Exception as e:
+        logger.error(f"Failed to start message stream: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to send message",
+        )
+
+    user_id = current_user.id
+    dream_id = data.dream_id
+
+    # Сессия запроса закрывается до окончания стрима — сохраняем в своей
+    async def on_complete(result_text: str, usage: dict) -> dict:
+        async with AsyncSessionLocal() as session:
+            assistant_msg = await create_message(
+                session,
+                user_id=user_id,
+                dream_id=dream_id,
+                role=MessageRole.ASSISTANT.value,
+                content=result_text,
+            )
+            await record_usage(session, user_id, UsageFeature.CHAT, usage, dream_id)
+        logger.info(f"Streamed chat reply saved for dream {dream_id}")
+        return {"message": ChatMessageResponse.model_validate(assistant_msg).model_dump(mode="json")}
+
+    async def on_error(error: Exception) -> None:
+        return None
+
+    async def events():
+        yield sse_event(
+            "user_message",
+            {"message": ChatMessageResponse.model_validate(user_msg).model_dump(mode="json")},
+        )
+        async for event in stream_completion(llm_messages, user_id, on_complete, on_error):
+            yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/dream/{dream_id}", response_model=ChatMessageListResponse)
 async def get_dream_messages(
     dream_id: UUID,
@@ -110,8 +208,8 @@ async def get_dream_messages(
 
 
 @router.get("/task/{task_id}")
-async def get_message_task(task_id: str, current_user: CurrentUser):
+async def get_message_task(task_id: str, current_user: CurrentUser, db: DatabaseSession):
     """
     Получить статус задачи ответа LLM для follow-up сообщений.
     """
-    return get_message_task_status(task_id)
+    return await get_message_task_status(db, task_id, current_user)
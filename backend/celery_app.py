@@ -1,8 +1,15 @@
 """Celery приложение для фоновых задач"""
 
 from celery import Celery
+from kombu import Queue
 from config import settings
 
+# Очереди по типам задач: долгие анализы не задерживают интерактивные ответы
+QUEUE_PRIORITY = "priority"  # follow-up ответы в чате и анализы premium-пользователей
+QUEUE_ANALYSIS = "analysis"  # первичные анализы (30–90 с каждый)
+QUEUE_BACKGROUND = "background"  # сжатие контекста в сводки
+QUEUE_EMAIL = "email"
+
 # Создание Celery приложения
 celery_app = Celery(
     "jungai",
@@ -21,5 +28,21 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 минут максимум на задачу
     task_soft_time_limit=25 * 60,  # 25 минут soft limit
+    # Воркер без -Q слушает все очереди; в docker-compose у каждой свой пул
+    task_queues=[
+        Queue(QUEUE_PRIORITY),
+        Queue(QUEUE_ANALYSIS),
+        Queue(QUEUE_BACKGROUND),
+        Queue(QUEUE_EMAIL),
+    ],
+    task_default_queue=QUEUE_ANALYSIS,
+    task_routes={
+        "tasks.analyze_dream": {"queue": QUEUE_ANALYSIS},  # premium — в QUEUE_PRIORITY при постановке
+        "tasks.reply_to_dream_chat": {"queue": QUEUE_PRIORITY},
+        "tasks.summarize_context": {"queue": QUEUE_BACKGROUND},
+        "tasks.send_email_task": {"queue": QUEUE_EMAIL},
+    },
+    # Задачи долгие: воркер не резервирует лишнего, очередь остаётся в брокере для свободных пулов
+    worker_prefetch_multiplier=1,
 )
 
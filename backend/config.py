@@ -30,9 +30,14 @@ class Settings(BaseSettings):
     
     # Database
     database_url: PostgresDsn
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
     
     # Redis
     redis_url: str = "redis://redis:6379/0"
+    # События о завершении задач (pub/sub в том же Redis) и WebSocket /events/ws
+    events_auth_timeout: float = 10.0  # сек на первое сообщение с токеном
+    events_heartbeat_interval: float = 30.0  # сек простоя до ping
     
     # JWT
     jwt_secret_key: SecretStr
@@ -68,6 +73,19 @@ class Settings(BaseSettings):
     
     # LLM Service
     llm_service_url: str = "http://llm_service:8001"
+    # Пул соединений к LLM Service (один клиент на процесс)
+    llm_max_connections: int = 20
+    llm_max_keepalive_connections: int = 10
+    llm_keepalive_expiry: float = 30.0
+    llm_http2: bool = True  # используется, если установлен пакет h2
+    # Повторы при 429 от LLM Service (очередь переполнена)
+    llm_busy_retries: int = 3
+    llm_busy_max_wait: float = 30.0
+    
+    # Бюджет контекста LLM (в токенах модели)
+    llm_tokenizer: str = "Qwen/Qwen3-235B-A22B-Instruct-2507-FP8"  # ID на HF Hub или путь к tokenizer.json
+    llm_context_window: int = 32768
+    llm_completion_reserve_tokens: int = 4096
     
     # Google Speech-to-Text
     google_application_credentials: str | None = None
@@ -84,6 +102,7 @@ class Settings(BaseSettings):
     
     # Лимиты
     dreams_per_day_limit: int = 5
+    llm_tokens_per_day_limit: int = 200000  # токенов LLM на пользователя в день, 0 — без лимита
     
     model_config = SettingsConfigDict(
         env_file=".env",
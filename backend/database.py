@@ -1,5 +1,6 @@
 """Подключение к базе данных"""
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from config import settings
@@ -9,8 +10,8 @@ engine = create_async_engine(
     str(settings.database_url),
     echo=settings.log_level == "DEBUG",
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow
 )
 
 # Создаем sessionmaker
@@ -25,6 +26,13 @@ AsyncSessionLocal = async_sessionmaker(
 # Base для моделей
 Base = declarative_base()
 
+# Колонки, добавленные в уже существующие таблицы: create_all их не создаёт,
+# поэтому init_db догоняет схему идемпотентным DDL (миграций в проекте нет)
+_SCHEMA_UPGRADES = (
+    "ALTER TABLE analysis_messages ADD COLUMN IF NOT EXISTS token_count integer",
+    "ALTER TABLE analyses ADD COLUMN IF NOT EXISTS generation integer NOT NULL DEFAULT 0",
+)
+
 
 async def get_db() -> AsyncSession:
     """
@@ -42,10 +50,12 @@ async def get_db() -> AsyncSession:
 
 async def init_db():
     """
-    Инициализация базы данных (создание таблиц)
+    Инициализация базы данных (создание таблиц и недостающих колонок)
     """
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in _SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
 
 
 async def close_db():
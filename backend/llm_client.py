@@ -1,12 +1,21 @@
 """HTTP клиент для взаимодействия с LLM Service"""
 
+import asyncio
+import importlib.util
+import json
 import logging
+from typing import AsyncIterator
+from uuid import UUID
+
 import httpx
 
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Заголовок с ID пользователя — по нему LLM Service делит очередь
+CLIENT_ID_HEADER = "X-Client-Id"
+
 
 class LLMClient:
     """Клиент для LLM Service"""
@@ -20,11 +29,79 @@ class LLMClient:
         """
         self.base_url = base_url or settings.llm_service_url
         self.timeout = 300.0  # 5 минут timeout для LLM запросов
+        self._client: httpx.AsyncClient | None = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Общий httpx-клиент процесса с пулом keep-alive соединений
+
+        Создаётся лениво; пересоздаётся, если закрыт или запрошен из другого
+        event loop (соединения пула привязаны к loop, в котором открыты).
+
+        Returns:
+            httpx.AsyncClient
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # HTTP/2 требует пакет h2; без него остаёмся на HTTP/1.1 keep-alive
+            http2 = settings.llm_http2 and importlib.util.find_spec("h2") is not None
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=settings.llm_max_connections,
+                    max_keepalive_connections=settings.llm_max_keepalive_connections,
+                    keepalive_expiry=settings.llm_keepalive_expiry,
+                ),
+            )
+            self._client_loop = loop
+            logger.info(
+                f"LLM Service HTTP client created: http2={http2}, "
+                f"max_connections={settings.llm_max_connections}"
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Закрыть общий httpx-клиент и его соединения"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("LLM Service HTTP client closed")
+        self._client = None
+        self._client_loop = None
     
+    @staticmethod
+    def _headers(user_id: UUID | str | None) -> dict:
+        """Заголовки запроса: ID пользователя для справедливой очереди LLM Service"""
+        return {CLIENT_ID_HEADER: str(user_id)} if user_id else {}
+
+    async def _post(self, url: str, payload: dict, user_id: UUID | str | None) -> httpx.Response:
+        """
+        POST в LLM Service с повтором при 429 (очередь сервиса переполнена)
+
+        Ждёт столько, сколько подсказал сервис в Retry-After, но не дольше
+        llm_busy_max_wait за раз и не больше llm_busy_retries раз.
+        """
+        for attempt in range(settings.llm_busy_retries + 1):
+            response = await self._get_client().post(url, json=payload, headers=self._headers(user_id))
+            if response.status_code != 429 or attempt == settings.llm_busy_retries:
+                break
+            retry_after = response.headers.get("Retry-After", "")
+            delay = min(
+                float(retry_after) if retry_after.isdigit() else 1.0,
+                settings.llm_busy_max_wait,
+            )
+            logger.warning(f"LLM Service is busy, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+        response.raise_for_status()
+        return response
+
     async def analyze_dream(
         self,
         dream_text: str,
-        user_description: str | None = None
+        user_description: str | None = None,
+        user_id: UUID | str | None = None,
+        usage: dict | None = None,
     ) -> str:
         """
         Отправить запрос на анализ сна в LLM Service
@@ -32,6 +109,8 @@ class LLMClient:
         Args:
             dream_text: Текст сна
             user_description: Описание пользователя (опционально)
+            user_id: ID пользователя для очереди LLM Service (опционально)
+            usage: Словарь, куда записываются prompt_tokens/completion_tokens (опционально)
         
         Returns:
             Результат анализа
@@ -50,18 +129,19 @@ class LLMClient:
         logger.debug(f"Payload: text_length={len(dream_text)}")
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-                
-                data = response.json()
-                result = data.get("result")
-                
-                if not result:
-                    raise ValueError("Empty result from LLM Service")
-                
-                logger.info(f"Successfully received analysis, length: {len(result)} chars")
-                return result
+            response = await self._post(url, payload, user_id)
+            
+            data = response.json()
+            result = data.get("result")
+            
+            if not result:
+                raise ValueError("Empty result from LLM Service")
+            
+            if usage is not None:
+                usage.update(data.get("usage") or {})
+            
+            logger.info(f"Successfully received analysis, length: {len(result)} chars")
+            return result
         
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error from LLM Service: {e.response.status_code} - {e.response.text}")
@@ -78,12 +158,16 @@ class LLMClient:
     async def chat_completion(
         self,
         messages: list[dict],
+        user_id: UUID | str | None = None,
+        usage: dict | None = None,
     ) -> str:
         """
         Отправить массив сообщений в LLM Service /chat
 
         Args:
             messages: Список сообщений [{role, text}, ...]
+            user_id: ID пользователя для очереди LLM Service (опционально)
+            usage: Словарь, куда записываются prompt_tokens/completion_tokens (опционально)
 
         Returns:
             Текст ответа LLM
@@ -98,18 +182,19 @@ class LLMClient:
         logger.info(f"Sending chat request to LLM Service: {url}, {len(messages)} messages")
 
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
+            response = await self._post(url, payload, user_id)
 
-                data = response.json()
-                result = data.get("result")
+            data = response.json()
+            result = data.get("result")
 
-                if not result:
-                    raise ValueError("Empty result from LLM Service chat")
+            if not result:
+                raise ValueError("Empty result from LLM Service chat")
 
-                logger.info(f"Successfully received chat response, length: {len(result)} chars")
-                return result
+            if usage is not None:
+                usage.update(data.get("usage") or {})
+
+            logger.info(f"Successfully received chat response, length: {len(result)} chars")
+            return result
 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error from LLM Service chat: {e.response.status_code} - {e.response.text}")
@@ -123,6 +208,62 @@ class LLMClient:
             logger.error(f"Unexpected error calling LLM Service chat: {e}")
             raise
 
+    async def chat_completion_stream(
+        self,
+        messages: list[dict],
+        user_id: UUID | str | None = None,
+        usage: dict | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Отправить массив сообщений в LLM Service /chat/stream
+
+        Args:
+            messages: Список сообщений [{role, text}, ...]
+            user_id: ID пользователя для очереди LLM Service (опционально)
+            usage: Словарь, куда записываются prompt_tokens/completion_tokens (опционально)
+
+        Yields:
+            Фрагменты ответа LLM по мере генерации
+
+        Raises:
+            Exception: При ошибке запроса или обрыве стрима
+        """
+        url = f"{self.base_url}/chat/stream"
+
+        payload = {"messages": messages}
+
+        logger.info(f"Sending chat stream request to LLM Service: {url}, {len(messages)} messages")
+
+        try:
+            async with self._get_client().stream(
+                "POST", url, json=payload, headers=self._headers(user_id)
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                    logger.error(
+                        f"HTTP error from LLM Service stream: {response.status_code} - {response.text}"
+                    )
+                    raise Exception(f"LLM Service chat error: {response.status_code}")
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if event.get("error"):
+                        raise Exception(f"LLM Service stream error: {event['error']}")
+                    if event.get("done"):
+                        if usage is not None:
+                            usage.update(event.get("usage") or {})
+                        return
+                    if event.get("delta"):
+                        yield event["delta"]
+
+        except httpx.RequestError as e:
+            logger.error(f"Request error to LLM Service stream: {e}")
+            raise Exception("Failed to connect to LLM Service")
+
+        raise Exception("LLM Service stream ended unexpectedly")
+
     async def health_check(self) -> bool:
         """
         Проверить доступность LLM Service
@@ -133,9 +274,8 @@ class LLMClient:
         url = f"{self.base_url}/health"
         
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(url)
-                return response.status_code == 200
+            response = await self._get_client().get(url, timeout=5.0)
+            return response.status_code == 200
         except:
             return False
 
@@ -1,5 +1,6 @@
 """Backend приложение JungAI"""
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
@@ -8,12 +9,16 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from config import settings
 from database import init_db, close_db
+from llm_client import llm_client
+from services.event_service import event_bus
+from tokenizer import get_tokenizer
 from api import auth
 from api import dreams
 from api import analyses
 from api import messages
 from api import users
 from api import stats
+from api import events
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,9 +35,13 @@ async def lifespan(app: FastAPI):
     logger.info("Starting JungAI Backend...")
     await init_db()
     logger.info("Database initialized")
+    # Токенизатор грузится один раз, вне обработки запросов
+    await asyncio.to_thread(get_tokenizer)
     yield
     # Shutdown
     logger.info("Shutting down JungAI Backend...")
+    await llm_client.aclose()
+    await event_bus.aclose()
     await close_db()
     logger.info("Database connection closed")
 
@@ -61,6 +70,7 @@ app.include_router(analyses.router, prefix="/api/v1")
 app.include_router(messages.router, prefix="/api/v1")
 app.include_router(users.router, prefix="/api/v1")
 app.include_router(stats.router, prefix="/api/v1")
+app.include_router(events.router, prefix="/api/v1")
 
 # TODO: Подключить остальные роутеры
 # app.include_router(user.router, prefix="/api/v1")
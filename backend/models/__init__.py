@@ -5,6 +5,9 @@ from .dream import Dream
 from .analysis import Analysis, AnalysisStatus
 from .analysis_message import AnalysisMessage, MessageRole
 from .oauth import OAuthIdentity, EmailVerification, PasswordReset
+from .context_snapshot import UserContextSnapshot
+from .context_summary import ContextSummary, SummaryLevel
+from .token_usage import TokenUsage, UsageFeature
 
 __all__ = [
     "User",
@@ -18,4 +21,9 @@ __all__ = [
     "OAuthIdentity",
     "EmailVerification",
     "PasswordReset",
+    "UserContextSnapshot",
+    "ContextSummary",
+    "SummaryLevel",
+    "TokenUsage",
+    "UsageFeature",
 ]
@@ -2,7 +2,7 @@
 
 import uuid
 from datetime import datetime
-from sqlalchemy import Text, DateTime, ForeignKey, UniqueConstraint, String
+from sqlalchemy import Text, DateTime, ForeignKey, UniqueConstraint, String, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database import Base
@@ -53,6 +53,8 @@ class Analysis(Base):
         index=True
     )
     celery_task_id: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
+    # Номер запроса анализа: растёт при каждом сбросе, задачи старых поколений не сохраняют результат
+    generation: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
     
     # Временные метки
@@ -0,0 +1,45 @@
+"""Модель снапшота LLM-контекста пользователя"""
+
+import uuid
+from datetime import datetime
+from sqlalchemy import BigInteger, Integer, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Base
+
+
+class UserContextSnapshot(Base):
+    """
+    Инкрементально поддерживаемый набор якорей для LLM-контекста.
+
+    anchors — список снов пользователя в порядке dreams.created_at:
+    {"dream_id", "created_at", "user", "assistant", "user_tokens", "assistant_tokens", "terms"},
+    где user/assistant — первое сообщение соответствующей роли по сну,
+    terms — частоты термов текста сна для BM25-ранжирования.
+    version — формат anchors; снапшот другой версии пересобирается при чтении.
+    prompt_hashes — [хэш префикса, токены префикса] по сообщениям последнего промпта,
+    prompt_tokens_* — накопленная статистика повторного использования префикса.
+    """
+
+    __tablename__ = "user_context_snapshots"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    anchors: Mapped[list] = mapped_column(JSONB, default=list, nullable=False)
+    total_tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    prompt_hashes: Mapped[list] = mapped_column(JSONB, default=list, nullable=False)
+    prompt_tokens_total: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    prompt_tokens_reused: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<UserContextSnapshot(user_id={self.user_id}, anchors={len(self.anchors)})>"
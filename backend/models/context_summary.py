@@ -0,0 +1,53 @@
+"""Модель сжатой сводки старых снов для LLM-контекста"""
+
+import uuid
+import enum
+from datetime import datetime
+from sqlalchemy import String, Text, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Base
+
+
+class SummaryLevel(str, enum.Enum):
+    """Уровни сводок"""
+    MONTH = "month"
+    QUARTER = "quarter"
+
+
+class ContextSummary(Base):
+    """Сводка якорей (сон + анализ) за месяц или квартал"""
+
+    __tablename__ = "context_summaries"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    level: Mapped[str] = mapped_column(String(16), nullable=False)
+    # "2026-03" для месяца, "2026-Q1" для квартала
+    period: Mapped[str] = mapped_column(String(7), nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    token_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Хэш исходных якорей (или сводок месяцев) — сводка пересобирается при его изменении
+    source_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False
+    )
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period", name="uq_context_summary_user_period"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ContextSummary(user_id={self.user_id}, period={self.period})>"
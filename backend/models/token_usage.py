@@ -0,0 +1,55 @@
+"""Модель журнала расхода токенов LLM"""
+
+import uuid
+import enum
+from datetime import datetime
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from database import Base
+
+
+class UsageFeature(str, enum.Enum):
+    """На что потрачены токены"""
+    ANALYSIS = "analysis"
+    CHAT = "chat"
+    SUMMARY = "summary"
+
+
+class TokenUsage(Base):
+    """Одна запись журнала: токены одного вызова LLM"""
+
+    __tablename__ = "token_usage"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        default=uuid.uuid4
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    # Сон, к которому относится вызов (у сводок его нет); при удалении сна запись остаётся
+    dream_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("dreams.id", ondelete="SET NULL"),
+        nullable=True
+    )
+    feature: Mapped[str] = mapped_column(String(16), nullable=False)
+    prompt_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    completion_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_tokens: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        nullable=False
+    )
+
+    __table_args__ = (
+        Index("ix_token_usage_user_created", "user_id", "created_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<TokenUsage(user_id={self.user_id}, feature={self.feature}, total={self.total_tokens})>"
@@ -17,6 +17,7 @@ def get_chat_system_prompt(user_description: str | None = None) -> str:
         "",
         "You are in a multi-turn conversation about the user's dreams. "
         "The conversation contains ALL dreams the user has recorded, each marked with [Сон от DD.MM.YYYY] or [Текущий сон от DD.MM.YYYY]. "
+        "Older dreams may be condensed into recaps marked [Сводка снов за MM.YYYY] or [Сводка снов за N кв. YYYY]. "
         "You can see the full history and your previous analyses.",
         "",
         "YOUR TASK IN THIS MODE:",
@@ -37,8 +38,34 @@ def get_chat_system_prompt(user_description: str | None = None) -> str:
         "FINAL REMINDER: Your response must be in the same language as the user's messages!",
     ]
 
+    # Описание пользователя идёт в конце: общий для всех пользователей текст
+    # остаётся побайтно одинаковым префиксом и кэшируется провайдером
     if user_description:
-        sections.insert(3, f"USER CONTEXT: {user_description}")
-        sections.insert(4, "")
+        sections.extend(["", f"USER CONTEXT: {user_description}"])
+
+    return "\n".join(sections)
+
+
+def get_summary_prompt() -> str:
+    """Системный промпт для сжатия старых снов в сводку."""
+
+    sections: list[str] = [
+        "CRITICAL LANGUAGE REQUIREMENT",
+        "You MUST write in the EXACT same language as the dreams below.",
+        "",
+        "You are Oneiros, a Jungian dream analyst, preparing a compact recap of a period of the user's dream journal. "
+        "The input contains dreams with your earlier analyses, or recaps of shorter periods.",
+        "",
+        "WRITE A RECAP THAT PRESERVES:",
+        "- Key images and recurring symbols, with the dates they appeared",
+        "- Active archetypes and how they developed",
+        "- Central conflicts, emotional tone and individuation markers",
+        "- Connections between dreams inside the period",
+        "",
+        "RULES:",
+        "- Flowing prose, no headings, no questions to the user.",
+        "- At most 300 words.",
+        "- Do not invent content that is not in the input.",
+    ]
 
     return "\n".join(sections)
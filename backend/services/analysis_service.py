@@ -1,14 +1,16 @@
 """Сервис для анализа снов"""
 
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from uuid import UUID
 
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import Analysis, AnalysisMessage, Dream, User, AnalysisStatus
-from celery_app import celery_app
+from models import Analysis, AnalysisMessage, Dream, User, AnalysisStatus, MessageRole, UserRole
+from celery_app import celery_app, QUEUE_ANALYSIS, QUEUE_PRIORITY
+from services.context_snapshot_service import remove_dream
+from services.message_service import create_message
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +40,17 @@ async def get_analysis_by_dream_id(
     return result.scalar_one_or_none()
 
 
-async def create_analysis(
+async def prepare_analysis(
     db: AsyncSession,
     dream: Dream,
     user: User
-) -> tuple[Analysis, str]:
+) -> Analysis:
     """
-    Создать анализ сна и запустить фоновую задачу
+    Создать запись анализа сна или сбросить существующую
+    
+    При сбросе удаляются сообщения чата по сну, увеличивается поколение
+    анализа (задачи прежних поколений не сохранят результат), а ещё не
+    начатая Celery-задача прежнего запроса отзывается.
     
     Args:
         db: Сессия базы данных
@@ -52,14 +58,17 @@ async def create_analysis(
         user: Пользователь
     
     Returns:
-        Кортеж (анализ, task_id)
-    
-    Raises:
-        ValueError: Если анализ уже существует
+        Анализ в статусе pending
     """
-    from tasks import analyze_dream_task
-
-    existing_analysis = await get_analysis_by_dream_id(db, dream.id, user)
+    # Строка анализа блокируется первой — в том же порядке, что и в
+    # complete_analysis (анализ, затем снапшот контекста), иначе сброс,
+    # совпавший с сохранением результата, взаимно заблокируется с ним
+    result = await db.execute(
+        select(Analysis)
+        .where(Analysis.dream_id == dream.id, Analysis.user_id == user.id)
+        .with_for_update()
+    )
+    existing_analysis = result.scalar_one_or_none()
 
     if existing_analysis:
         # Сбрасываем существующий анализ и чистим старые сообщения
@@ -69,19 +78,23 @@ async def create_analysis(
                 AnalysisMessage.user_id == user.id,
             )
         )
+        await remove_dream(db, user.id, dream.id)
+        if existing_analysis.celery_task_id and existing_analysis.status in (
+            AnalysisStatus.PENDING.value,
+            AnalysisStatus.PROCESSING.value,
+        ):
+            # Задача в очереди будет отброшена; уже выполняющуюся остановит проверка поколения
+            celery_app.control.revoke(existing_analysis.celery_task_id)
+            logger.info(f"Revoked superseded task {existing_analysis.celery_task_id} of analysis {existing_analysis.id}")
+        existing_analysis.generation = Analysis.generation + 1
+        existing_analysis.celery_task_id = None
         existing_analysis.result = None
         existing_analysis.error_message = None
         existing_analysis.completed_at = None
         existing_analysis.status = AnalysisStatus.PENDING.value
         await db.commit()
         await db.refresh(existing_analysis)
-
-        task = analyze_dream_task.delay(str(existing_analysis.id))
-        existing_analysis.celery_task_id = task.id
-        await db.commit()
-
-        logger.info(f"Analysis {existing_analysis.id} reset and requeued with task_id {task.id}")
-        return existing_analysis, task.id
+        return existing_analysis
 
     # Создаём новую запись анализа
     analysis = Analysis(
@@ -93,15 +106,206 @@ async def create_analysis(
     db.add(analysis)
     await db.commit()
     await db.refresh(analysis)
+    return analysis
+
+
+def analysis_queue(user: User) -> str:
+    """
+    Очередь Celery для анализа пользователя
+
+    Анализы premium-пользователей с действующей подпиской идут в
+    приоритетную очередь и не ждут общего бэклога анализов.
+
+    Args:
+        user: Пользователь
+
+    Returns:
+        Имя очереди
+    """
+    if user.sub_type == UserRole.PREMIUM.value and (
+        user.sub_expires_at is None or user.sub_expires_at > datetime.now(timezone.utc)
+    ):
+        return QUEUE_PRIORITY
+    return QUEUE_ANALYSIS
+
+
+async def create_analysis(
+    db: AsyncSession,
+    dream: Dream,
+    user: User
+) -> tuple[Analysis, str]:
+    """
+    Создать анализ сна и запустить фоновую задачу
+    
+    Args:
+        db: Сессия базы данных
+        dream: Сон для анализа
+        user: Пользователь
+    
+    Returns:
+        Кортеж (анализ, task_id)
+    
+    Raises:
+        ValueError: Если анализ уже существует
+    """
+    from tasks import analyze_dream_task
+
+    analysis = await prepare_analysis(db, dream, user)
 
-    task = analyze_dream_task.delay(str(analysis.id))
+    task = analyze_dream_task.apply_async(
+        args=[str(analysis.id), analysis.generation],
+        queue=analysis_queue(user),
+    )
     analysis.celery_task_id = task.id
     await db.commit()
 
-    logger.info(f"Analysis {analysis.id} created with task_id {task.id}")
+    logger.info(f"Analysis {analysis.id} queued with task_id {task.id}")
     return analysis, task.id
 
 
+async def is_analysis_current(
+    db: AsyncSession,
+    analysis_id: UUID,
+    generation: int
+) -> bool:
+    """
+    Проверить, что анализ не был перезапрошен после запуска задачи
+    
+    Args:
+        db: Сессия базы данных
+        analysis_id: ID анализа
+        generation: Поколение, с которым запущена задача
+    
+    Returns:
+        True если поколение актуально
+    """
+    result = await db.execute(
+        select(Analysis.generation).where(Analysis.id == analysis_id)
+    )
+    return result.scalar_one_or_none() == generation
+
+
+async def create_analysis_user_message(
+    db: AsyncSession,
+    analysis_id: UUID,
+    generation: int,
+    content: str
+) -> bool:
+    """
+    Записать текст сна первым сообщением чата, если анализ всё ещё актуален
+    
+    Проверка поколения и вставка идут под блокировкой строки анализа,
+    поэтому перезапрос не может удалить сообщения между ними и оставить
+    в новом чате сообщение устаревшей задачи.
+    
+    Args:
+        db: Сессия базы данных
+        analysis_id: ID анализа
+        generation: Поколение, с которым запущена задача
+        content: Текст сна
+    
+    Returns:
+        True если сообщение записано, False если анализ перезапрошен
+    """
+    result = await db.execute(
+        select(Analysis)
+        .where(Analysis.id == analysis_id, Analysis.generation == generation)
+        .with_for_update()
+    )
+    analysis = result.scalar_one_or_none()
+    if analysis is None:
+        await db.rollback()
+        return False
+
+    # create_message коммитит транзакцию и снимает блокировку
+    await create_message(
+        db,
+        user_id=analysis.user_id,
+        dream_id=analysis.dream_id,
+        role=MessageRole.USER.value,
+        content=content,
+    )
+    return True
+
+
+async def complete_analysis(
+    db: AsyncSession,
+    analysis_id: UUID,
+    generation: int,
+    result_text: str
+) -> bool:
+    """
+    Сохранить результат анализа, если он всё ещё актуален
+    
+    Строка анализа блокируется до коммита, поэтому перезапрос не может
+    вклиниться между проверкой поколения и записью: assistant-сообщение
+    и статус сохраняются в одной транзакции либо не сохраняются вовсе.
+    
+    Args:
+        db: Сессия базы данных
+        analysis_id: ID анализа
+        generation: Поколение, с которым запущена генерация
+        result_text: Текст анализа
+    
+    Returns:
+        True если сохранено, False если анализ перезапрошен
+    """
+    result = await db.execute(
+        select(Analysis)
+        .where(Analysis.id == analysis_id, Analysis.generation == generation)
+        .with_for_update()
+    )
+    analysis = result.scalar_one_or_none()
+    if analysis is None:
+        await db.rollback()
+        logger.info(f"Analysis {analysis_id} generation {generation} superseded, result discarded")
+        return False
+
+    # Backward compat: результат дублируется в Analysis.result
+    analysis.result = result_text
+    analysis.status = AnalysisStatus.COMPLETED.value
+    analysis.completed_at = datetime.utcnow()
+    # create_message коммитит транзакцию вместе с изменениями анализа
+    await create_message(
+        db,
+        user_id=analysis.user_id,
+        dream_id=analysis.dream_id,
+        role=MessageRole.ASSISTANT.value,
+        content=result_text,
+    )
+    return True
+
+
+async def fail_analysis(
+    db: AsyncSession,
+    analysis_id: UUID,
+    generation: int,
+    error_message: str
+) -> bool:
+    """
+    Отметить анализ неудавшимся, если он всё ещё актуален
+    
+    Args:
+        db: Сессия базы данных
+        analysis_id: ID анализа
+        generation: Поколение, с которым запущена генерация
+        error_message: Текст ошибки
+    
+    Returns:
+        True если статус обновлён, False если анализ перезапрошен
+    """
+    result = await db.execute(
+        update(Analysis)
+        .where(Analysis.id == analysis_id, Analysis.generation == generation)
+        .values(
+            status=AnalysisStatus.FAILED.value,
+            error_message=error_message,
+        )
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
 async def get_analysis_by_id(
     db: AsyncSession,
     analysis_id: UUID,
@@ -127,12 +331,18 @@ async def get_analysis_by_id(
     return result.scalar_one_or_none()
 
 
-async def get_task_status(task_id: str) -> dict:
+async def get_task_status(db: AsyncSession, task_id: str, user: User) -> dict:
     """
     Получить статус Celery задачи
     
+    Задача хранит в result backend только статус, текст анализа читается
+    из Analysis.result. Анализ ищется среди анализов пользователя, поэтому
+    чужой task_id результата не раскрывает.
+    
     Args:
+        db: Сессия базы данных
         task_id: ID задачи
+        user: Пользователь
     
     Returns:
         Словарь со статусом задачи
@@ -151,7 +361,14 @@ async def get_task_status(task_id: str) -> dict:
     
     if task_result.ready():
         if task_result.successful():
-            status_dict["result"] = task_result.result
+            result = await db.execute(
+                select(Analysis.result).where(
+                    Analysis.celery_task_id == task_id,
+                    Analysis.user_id == user.id,
+                    Analysis.status == AnalysisStatus.COMPLETED.value,
+                )
+            )
+            status_dict["result"] = result.scalar_one_or_none()
         elif task_result.failed():
             status_dict["error"] = str(task_result.info)
     
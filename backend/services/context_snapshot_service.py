@@ -0,0 +1,328 @@
+"""Сервис снапшота якорей LLM-контекста пользователя"""
+
+import hashlib
+import logging
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import exists, select, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import AnalysisMessage, MessageRole, Dream, UserContextSnapshot
+from services.relevance_service import term_frequencies
+from tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+_ANCHOR_ROLES = (MessageRole.USER.value, MessageRole.ASSISTANT.value)
+
+# Версия формата anchors (2 — размеры в токенах, 3 — частоты термов для BM25)
+SNAPSHOT_VERSION = 3
+
+
+def message_tokens(message: AnalysisMessage) -> int:
+    """Токены сообщения (для старых записей без token_count — считаем на лету)"""
+    if message.token_count is not None:
+        return message.token_count
+    return count_tokens(message.content)
+
+
+def _make_anchor(
+    dream_id: UUID,
+    created_at: datetime,
+    user: tuple[str, int] | None,
+    assistant: tuple[str, int] | None,
+) -> dict:
+    return {
+        "dream_id": str(dream_id),
+        "created_at": created_at.isoformat(),
+        "user": user[0] if user else None,
+        "assistant": assistant[0] if assistant else None,
+        "user_tokens": user[1] if user else 0,
+        "assistant_tokens": assistant[1] if assistant else 0,
+        # Стемминг текста сна делается один раз здесь, а не при каждой сборке контекста
+        "terms": term_frequencies(user[0]) if user else {},
+    }
+
+
+def _anchor_sort_key(anchor: dict) -> tuple[datetime, str]:
+    return datetime.fromisoformat(anchor["created_at"]), anchor["dream_id"]
+
+
+def _total_tokens(anchors: list[dict]) -> int:
+    return sum(a["user_tokens"] + a["assistant_tokens"] for a in anchors)
+
+
+async def load_anchors(db: AsyncSession, user_id: UUID) -> list[dict]:
+    """
+    Загрузить якоря всех снов пользователя одним запросом.
+
+    Для каждого сна берётся первое user- и первое assistant-сообщение
+    (row_number() по (dream_id, role)), сны упорядочены по дате создания.
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+
+    Returns:
+        Список якорей в формате UserContextSnapshot.anchors
+    """
+    ranked = (
+        select(
+            AnalysisMessage.dream_id.label("dream_id"),
+            AnalysisMessage.role.label("role"),
+            AnalysisMessage.content.label("content"),
+            AnalysisMessage.token_count.label("token_count"),
+            func.row_number()
+            .over(
+                partition_by=(AnalysisMessage.dream_id, AnalysisMessage.role),
+                order_by=AnalysisMessage.created_at.asc(),
+            )
+            .label("rn"),
+        )
+        .where(
+            AnalysisMessage.user_id == user_id,
+            AnalysisMessage.dream_id.is_not(None),
+            AnalysisMessage.role.in_(_ANCHOR_ROLES),
+        )
+        .subquery()
+    )
+
+    anchors_q = (
+        select(Dream.id, Dream.created_at, ranked.c.role, ranked.c.content, ranked.c.token_count)
+        .join(ranked, ranked.c.dream_id == Dream.id)
+        .where(Dream.user_id == user_id, ranked.c.rn == 1)
+        .order_by(Dream.created_at.asc(), Dream.id)
+    )
+    rows = (await db.execute(anchors_q)).all()
+
+    # dict сохраняет порядок вставки — сны уже отсортированы по дате
+    texts: dict[UUID, dict] = {}
+    for dream_id, dream_created_at, role, content, token_count in rows:
+        entry = texts.setdefault(dream_id, {"created_at": dream_created_at})
+        entry[role] = (content, token_count if token_count is not None else count_tokens(content))
+
+    return [
+        _make_anchor(
+            dream_id,
+            entry["created_at"],
+            entry.get(MessageRole.USER.value),
+            entry.get(MessageRole.ASSISTANT.value),
+        )
+        for dream_id, entry in texts.items()
+    ]
+
+
+async def get_snapshot(
+    db: AsyncSession,
+    user_id: UUID,
+    for_update: bool = False,
+) -> UserContextSnapshot:
+    """
+    Получить снапшот пользователя, построив его при первом обращении.
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        for_update: Заблокировать строку до конца транзакции (для изменения)
+
+    Returns:
+        Снапшот якорей. Если он был построен и for_update=False,
+        транзакция коммитится; иначе коммит остаётся за вызывающим кодом.
+    """
+    q = (
+        select(UserContextSnapshot)
+        .where(UserContextSnapshot.user_id == user_id)
+        .execution_options(populate_existing=True)
+    )
+    if for_update:
+        q = q.with_for_update()
+
+    snapshot = (await db.execute(q)).scalar_one_or_none()
+    if snapshot and snapshot.version == SNAPSHOT_VERSION:
+        return snapshot
+
+    anchors = await load_anchors(db, user_id)
+    values = {
+        "anchors": anchors,
+        "total_tokens": _total_tokens(anchors),
+        "version": SNAPSHOT_VERSION,
+        "updated_at": datetime.utcnow(),
+    }
+    insert_q = pg_insert(UserContextSnapshot).values(user_id=user_id, **values)
+    # Параллельная сборка другим воркером не должна падать на PK,
+    # а снапшот устаревшей версии перезаписывается
+    await db.execute(
+        insert_q.on_conflict_do_update(
+            index_elements=[UserContextSnapshot.user_id],
+            set_=values,
+            where=UserContextSnapshot.version != SNAPSHOT_VERSION,
+        )
+    )
+    if not for_update:
+        await db.commit()
+    logger.info(f"Context snapshot built for user {user_id}: {len(anchors)} anchors")
+
+    return (await db.execute(q)).scalar_one()
+
+
+async def apply_message(db: AsyncSession, message: AnalysisMessage) -> None:
+    """
+    Учесть новое сообщение в снапшоте (без коммита).
+
+    Меняет снапшот, только если сообщение — первое своей роли по сну.
+    Для follow-up это видно по индексу analysis_messages, поэтому строка
+    снапшота блокируется и читается только когда якорь действительно меняется.
+
+    Args:
+        db: Сессия базы данных
+        message: Уже добавленное в сессию (flush) сообщение
+    """
+    if message.dream_id is None or message.role not in _ANCHOR_ROLES:
+        return
+
+    has_earlier = (
+        await db.execute(
+            select(
+                exists().where(
+                    AnalysisMessage.user_id == message.user_id,
+                    AnalysisMessage.dream_id == message.dream_id,
+                    AnalysisMessage.role == message.role,
+                    AnalysisMessage.id != message.id,
+                )
+            )
+        )
+    ).scalar()
+    if has_earlier:
+        return
+
+    snapshot = await get_snapshot(db, message.user_id, for_update=True)
+    anchors = list(snapshot.anchors)
+    key = str(message.dream_id)
+
+    index = next((i for i, a in enumerate(anchors) if a["dream_id"] == key), None)
+    if index is None:
+        created_at = (
+            await db.execute(select(Dream.created_at).where(Dream.id == message.dream_id))
+        ).scalar_one_or_none()
+        if created_at is None:
+            return
+        anchor = _make_anchor(message.dream_id, created_at, None, None)
+    elif anchors[index][message.role] is not None:
+        return
+    else:
+        anchor = anchors.pop(index)
+
+    anchor = {
+        **anchor,
+        message.role: message.content,
+        f"{message.role}_tokens": message_tokens(message),
+    }
+    if message.role == MessageRole.USER.value:
+        anchor["terms"] = term_frequencies(message.content)
+    anchors.append(anchor)
+    anchors.sort(key=_anchor_sort_key)
+
+    # JSONB без MutableList — изменения фиксируются только присваиванием
+    snapshot.anchors = anchors
+    snapshot.total_tokens = _total_tokens(anchors)
+
+
+async def remove_dream(db: AsyncSession, user_id: UUID, dream_id: UUID) -> None:
+    """
+    Убрать якоря сна из снапшота (без коммита).
+
+    Вызывается при удалении сна и при сбросе его сообщений.
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        dream_id: ID сна
+    """
+    snapshot = (
+        await db.execute(
+            select(UserContextSnapshot)
+            .where(UserContextSnapshot.user_id == user_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+    ).scalar_one_or_none()
+    if not snapshot:
+        return
+
+    key = str(dream_id)
+    anchors = [a for a in snapshot.anchors if a["dream_id"] != key]
+    if len(anchors) != len(snapshot.anchors):
+        snapshot.anchors = anchors
+        snapshot.total_tokens = _total_tokens(anchors)
+
+
+def prompt_hashes(messages: list[dict], tokens: list[int]) -> list[list]:
+    """
+    Цепочка хэшей префиксов промпта
+
+    Args:
+        messages: Сообщения промпта [{role, text}, ...]
+        tokens: Токены каждого сообщения
+
+    Returns:
+        [[хэш префикса до сообщения i включительно, токены этого префикса], ...]
+    """
+    digest = hashlib.sha256()
+    hashes: list[list] = []
+    prefix_tokens = 0
+    for msg, msg_tokens in zip(messages, tokens):
+        digest.update(msg["role"].encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(msg["text"].encode("utf-8"))
+        digest.update(b"\x00")
+        prefix_tokens += msg_tokens
+        hashes.append([digest.copy().hexdigest()[:16], prefix_tokens])
+    return hashes
+
+
+async def record_prompt(
+    db: AsyncSession,
+    snapshot: UserContextSnapshot,
+    messages: list[dict],
+    tokens: list[int],
+) -> int:
+    """
+    Сравнить промпт с предыдущим промптом пользователя и сохранить статистику
+
+    Совпавший побайтно префикс провайдер может отдать из KV/prompt-кэша.
+
+    Args:
+        db: Сессия базы данных
+        snapshot: Снапшот пользователя (с хэшами прошлого промпта)
+        messages: Сообщения нового промпта
+        tokens: Токены каждого сообщения
+
+    Returns:
+        Количество токенов общего префикса с предыдущим промптом
+    """
+    hashes = prompt_hashes(messages, tokens)
+    reused = 0
+    for (old_hash, _), (new_hash, prefix_tokens) in zip(snapshot.prompt_hashes, hashes):
+        if old_hash != new_hash:
+            break
+        reused = prefix_tokens
+    total = hashes[-1][1] if hashes else 0
+
+    await db.execute(
+        update(UserContextSnapshot)
+        .where(UserContextSnapshot.user_id == snapshot.user_id)
+        .values(
+            prompt_hashes=hashes,
+            prompt_tokens_total=UserContextSnapshot.prompt_tokens_total + total,
+            prompt_tokens_reused=UserContextSnapshot.prompt_tokens_reused + reused,
+        )
+    )
+    await db.commit()
+
+    logger.info(
+        f"Prompt prefix reuse for user {snapshot.user_id}: "
+        f"{reused}/{total} tokens, {len(hashes)} messages"
+    )
+    return reused
@@ -0,0 +1,252 @@
+"""Сервис иерархических сводок старых снов (месяц → квартал)"""
+
+import hashlib
+import logging
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from llm_client import llm_client
+from models import ContextSummary, SummaryLevel, UsageFeature
+from prompts import get_summary_prompt
+from services.context_snapshot_service import get_snapshot
+from services.usage_service import add_usage, record_usage
+from tokenizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Последние N календарных месяцев (включая текущий) идут в контекст без сжатия
+RAW_MONTHS = 2
+# Месяцы старше N последних сворачиваются в квартальные сводки
+MONTHLY_MONTHS = 6
+# Запас токенов на chat-шаблон при сжатии
+_SUMMARY_TEMPLATE_TOKENS = 64
+
+
+def _month_index(dt: datetime) -> int:
+    return dt.year * 12 + dt.month - 1
+
+
+def _month_period(month_index: int) -> str:
+    return f"{month_index // 12}-{month_index % 12 + 1:02d}"
+
+
+def _quarter_period(month_index: int) -> str:
+    return f"{month_index // 12}-Q{month_index % 12 // 3 + 1}"
+
+
+def summary_periods(created_at: str, now: datetime) -> list[str]:
+    """
+    Сводки, которыми можно заменить якорь сна, в порядке предпочтения
+
+    Args:
+        created_at: Дата создания сна (ISO, как в снапшоте)
+        now: Текущее время
+
+    Returns:
+        [квартал, месяц], [месяц] или [] — якорь остаётся без сжатия
+    """
+    month = _month_index(datetime.fromisoformat(created_at))
+    now_month = _month_index(now)
+
+    if month > now_month - RAW_MONTHS:
+        return []
+    # Квартал сворачивается, только когда все его месяцы старше MONTHLY_MONTHS
+    quarter_last_month = month - month % 3 + 2
+    if quarter_last_month <= now_month - MONTHLY_MONTHS:
+        return [_quarter_period(month), _month_period(month)]
+    return [_month_period(month)]
+
+
+def summary_label(period: str) -> str:
+    """Префикс сводки в контексте: [Сводка снов за 03.2026] / [Сводка снов за 1 кв. 2026]"""
+    year, part = period.split("-")
+    if part.startswith("Q"):
+        return f"[Сводка снов за {part[1:]} кв. {year}]"
+    return f"[Сводка снов за {part}.{year}]"
+
+
+def _source_hash(parts: list[str]) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+async def get_summaries(db: AsyncSession, user_id: UUID) -> dict[str, ContextSummary]:
+    """
+    Получить все сводки пользователя
+
+    Returns:
+        Словарь period -> сводка
+    """
+    result = await db.execute(
+        select(ContextSummary).where(ContextSummary.user_id == user_id)
+    )
+    return {s.period: s for s in result.scalars().all()}
+
+
+async def _summarize(parts: list[tuple[str, int]], user_id: UUID, usage: dict) -> str:
+    """
+    Сжать тексты в одну сводку через LLM
+
+    Если вход не помещается в окно модели, он делится на части,
+    каждая сжимается отдельно, затем сжимаются промежуточные сводки.
+    Токены всех вызовов суммируются в usage.
+    """
+    system_prompt = get_summary_prompt()
+    budget = (
+        settings.llm_context_window
+        - settings.llm_completion_reserve_tokens
+        - count_tokens(system_prompt)
+        - _SUMMARY_TEMPLATE_TOKENS
+    )
+
+    chunks: list[list[str]] = []
+    current: list[str] = []
+    used = 0
+    for text, tokens in parts:
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += tokens
+    if current:
+        chunks.append(current)
+
+    partial: list[str] = []
+    for chunk in chunks:
+        call_usage: dict = {}
+        partial.append(await llm_client.chat_completion(messages=[
+            {"role": "system", "text": system_prompt},
+            {"role": "user", "text": "\n\n".join(chunk)},
+        ], user_id=user_id, usage=call_usage))
+        add_usage(usage, call_usage)
+
+    if len(partial) == 1:
+        return partial[0]
+    return await _summarize([(p, count_tokens(p)) for p in partial], user_id, usage)
+
+
+async def _store_summary(
+    db: AsyncSession,
+    user_id: UUID,
+    existing: dict[str, ContextSummary],
+    level: SummaryLevel,
+    period: str,
+    parts: list[tuple[str, int]],
+    source_hash: str,
+) -> ContextSummary:
+    """
+    Сгенерировать сводку, если исходные данные изменились, и сохранить её
+
+    Запись — upsert по (user_id, period): параллельный пересчёт того же
+    пользователя не падает на уникальном ключе, побеждает последняя запись.
+    """
+    summary = existing.get(period)
+    if summary and summary.source_hash == source_hash:
+        return summary
+
+    usage: dict = {}
+    content = await _summarize(parts, user_id, usage)
+    values = {
+        "level": level.value,
+        "content": content,
+        "token_count": count_tokens(content),
+        "source_hash": source_hash,
+        "updated_at": datetime.utcnow(),
+    }
+    insert_q = pg_insert(ContextSummary).values(user_id=user_id, period=period, **values)
+    summary = await db.scalar(
+        insert_q.on_conflict_do_update(
+            constraint="uq_context_summary_user_period",
+            set_=values,
+        )
+        .returning(ContextSummary)
+        .execution_options(populate_existing=True)
+    )
+    existing[period] = summary
+    # Коммитим каждую сводку, чтобы сбой LLM не терял уже сделанную работу
+    await db.commit()
+    await record_usage(db, user_id, UsageFeature.SUMMARY, usage)
+    logger.info(f"Context summary {period} generated for user {user_id}")
+    return summary
+
+
+async def refresh_summaries(db: AsyncSession, user_id: UUID) -> None:
+    """
+    Привести сводки пользователя в соответствие со снапшотом якорей
+
+    Сводки месяцев строятся из якорей, сводки кварталов — из сводок месяцев.
+    LLM вызывается только для периодов, исходные данные которых изменились;
+    сводки периодов без снов удаляются.
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+    """
+    snapshot = await get_snapshot(db, user_id)
+    existing = await get_summaries(db, user_id)
+    # Закрываем читающую транзакцию: вызовы LLM длятся минутами,
+    # соединение не должно всё это время висеть idle in transaction
+    await db.commit()
+    now = datetime.utcnow()
+
+    # Якоря по месяцам и месяцы по кварталам (dict сохраняет хронологию)
+    months: dict[str, list[dict]] = {}
+    quarters: dict[str, list[str]] = {}
+    for anchor in snapshot.anchors:
+        if anchor["user"] is None:
+            continue
+        periods = summary_periods(anchor["created_at"], now)
+        if not periods:
+            continue
+        month = periods[-1]
+        if month not in months:
+            months[month] = []
+            if len(periods) == 2:
+                quarters.setdefault(periods[0], []).append(month)
+        months[month].append(anchor)
+
+    for month, anchors in months.items():
+        parts = []
+        for a in anchors:
+            date_str = datetime.fromisoformat(a["created_at"]).strftime("%d.%m.%Y")
+            text = f"[Сон от {date_str}]\n{a['user']}"
+            if a["assistant"] is not None:
+                text += f"\n\n{a['assistant']}"
+            parts.append((text, a["user_tokens"] + a["assistant_tokens"] + _SUMMARY_TEMPLATE_TOKENS))
+
+        source_hash = _source_hash(
+            [f"{a['dream_id']}:{a['user']}:{a['assistant'] or ''}" for a in anchors]
+        )
+        await _store_summary(
+            db, user_id, existing, SummaryLevel.MONTH, month, parts, source_hash
+        )
+
+    for quarter, quarter_months in quarters.items():
+        month_summaries = [existing[m] for m in quarter_months]
+        parts = [
+            (f"{summary_label(s.period)}\n{s.content}", s.token_count + _SUMMARY_TEMPLATE_TOKENS)
+            for s in month_summaries
+        ]
+        source_hash = _source_hash([s.source_hash for s in month_summaries])
+        await _store_summary(
+            db, user_id, existing, SummaryLevel.QUARTER, quarter, parts, source_hash
+        )
+
+    stale = [p for p in existing if p not in months and p not in quarters]
+    if stale:
+        await db.execute(
+            delete(ContextSummary).where(
+                ContextSummary.user_id == user_id,
+                ContextSummary.period.in_(stale),
+            )
+        )
+        await db.commit()
+        logger.info(f"Removed {len(stale)} stale context summaries for user {user_id}")
@@ -12,6 +12,7 @@ from sqlalchemy.orm import selectinload
 from models import Dream, User
 from schemas import DreamCreate, DreamUpdate
 from config import settings
+from services.context_snapshot_service import remove_dream
 
 logger = logging.getLogger(__name__)
 
@@ -260,10 +261,16 @@ async def delete_dream(
         db: Сессия базы данных
         dream: Сон для удаления
     """
+    from tasks import summarize_context_task
+
+    await remove_dream(db, dream.user_id, dream.id)
     await db.delete(dream)
     await db.commit()
     logger.info(f"Dream deleted: {dream.id}")
 
+    # Сводка периода, в который входил сон, устарела
+    summarize_context_task.delay(str(dream.user_id))
+
 
 async def search_dreams(
     db: AsyncSession,
@@ -0,0 +1,179 @@
+"""Сервис событий о завершении фоновых задач (Redis pub/sub)"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator
+from uuid import UUID
+
+import redis.asyncio as redis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Типы событий
+ANALYSIS_READY = "analysis_ready"
+REPLY_READY = "reply_ready"
+
+_CHANNEL_PREFIX = "events:user:"
+# Сколько событий копится для одного сокета, пока клиент их не забрал
+_SUBSCRIBER_QUEUE_SIZE = 100
+# Пауза перед переподключением слушателя после ошибки Redis, сек
+_RECONNECT_DELAY = 1.0
+
+
+def user_channel(user_id: UUID | str) -> str:
+    """Канал Redis с событиями одного пользователя"""
+    return f"{_CHANNEL_PREFIX}{user_id}"
+
+
+class EventBus:
+    """
+    Публикация и подписка на события пользователей через Redis pub/sub
+
+    Процесс держит одно pubsub-соединение с psubscribe на каналы всех
+    пользователей и раздаёт события локальным подписчикам через очереди,
+    а не открывает соединение на каждый WebSocket.
+    """
+
+    def __init__(self, redis_url: str = None):
+        """
+        Инициализация шины
+
+        Args:
+            redis_url: URL Redis
+        """
+        self.redis_url = redis_url or settings.redis_url
+        self._client: redis.Redis | None = None
+        self._client_loop: asyncio.AbstractEventLoop | None = None
+        # user_id -> очереди подписчиков этого процесса
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._listener: asyncio.Task | None = None
+
+    def _get_client(self) -> redis.Redis:
+        """
+        Общий Redis-клиент процесса
+
+        Пересоздаётся, если запрошен из другого event loop (соединения пула
+        привязаны к loop, в котором открыты).
+
+        Returns:
+            redis.Redis
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = redis.from_url(self.redis_url, decode_responses=True)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        """Остановить слушатель и закрыть Redis-клиент"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._client_loop = None
+
+    async def publish(self, user_id: UUID | str, event: dict) -> None:
+        """
+        Опубликовать событие для пользователя
+
+        Ошибка публикации не должна ронять задачу: результат уже в БД,
+        клиент без события узнает о нём опросом статуса задачи.
+
+        Args:
+            user_id: ID пользователя
+            event: Событие {"type": ..., ...}
+        """
+        try:
+            receivers = await self._get_client().publish(
+                user_channel(user_id), json.dumps(event, ensure_ascii=False, default=str)
+            )
+            logger.info(f"Published {event.get('type')} for user {user_id} to {receivers} subscriber(s)")
+        except Exception as e:
+            logger.warning(f"Failed to publish {event.get('type')} for user {user_id}: {e}")
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        """Раздать событие из Redis очередям подписчиков его пользователя"""
+        queues = self._subscribers.get(channel.removeprefix(_CHANNEL_PREFIX))
+        if not queues:
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            logger.warning(f"Malformed event on {channel}: {data[:200]}")
+            return
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Event queue full on {channel}, dropping {event.get('type')}")
+
+    async def _listen(self) -> None:
+        """
+        Читать события всех пользователей из одного pubsub-соединения
+
+        При обрыве соединения переподключается; события, опубликованные
+        в этот промежуток, теряются — клиент узнает о них опросом статуса.
+        """
+        while True:
+            pubsub = self._get_client().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{_CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event listener failed, reconnecting: {e}")
+                await asyncio.sleep(_RECONNECT_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    def _ensure_listener(self) -> None:
+        """Запустить слушатель в текущем event loop, если он ещё не работает"""
+        self._get_client()
+        if (
+            self._listener is None
+            or self._listener.done()
+            or self._listener.get_loop() is not self._client_loop
+        ):
+            self._listener = asyncio.create_task(self._listen())
+
+    async def subscribe(self, user_id: UUID | str, timeout: float) -> AsyncIterator[dict | None]:
+        """
+        Подписаться на события пользователя
+
+        Args:
+            user_id: ID пользователя
+            timeout: Сколько ждать событие, сек; по истечении отдаётся None
+                (для heartbeat)
+
+        Yields:
+            Событие или None, если за timeout событий не было
+        """
+        self._ensure_listener()
+        key = str(user_id)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(key, set()).add(queue)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            queues = self._subscribers.get(key)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[key]
+
+
+# Глобальный экземпляр шины
+event_bus = EventBus()
@@ -1,17 +1,28 @@
 """Сервис для работы с сообщениями анализа и сборки контекста для LLM"""
 
+import asyncio
 import logging
+from datetime import datetime
 from uuid import UUID
 
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import AnalysisMessage, MessageRole, Dream, User
+from config import settings
+from models import AnalysisMessage, MessageRole
+from services.context_snapshot_service import apply_message, get_snapshot, message_tokens, record_prompt
+from services.context_summary_service import get_summaries, summary_label, summary_periods
+from services.relevance_service import bm25_scores, term_frequencies
+from tokenizer import count_tokens
 
 logger = logging.getLogger(__name__)
 
-# Бюджет символов для контекста LLM (~7000 токенов)
-CONTEXT_CHAR_BUDGET = 28000
+# Бюджет токенов промпта: окно модели минус резерв под ответ
+CONTEXT_TOKEN_BUDGET = settings.llm_context_window - settings.llm_completion_reserve_tokens
+# Служебные токены chat-шаблона на сообщение (<|im_start|>role\n ... <|im_end|>\n)
+MESSAGE_OVERHEAD_TOKENS = 5
+# Токены, которыми шаблон открывает ответ ассистента (<|im_start|>assistant\n)
+REPLY_PRIMING_TOKENS = 3
 # Максимум последних follow-up сообщений текущего сна
 MAX_RECENT_MESSAGES = 20
 
@@ -29,8 +40,12 @@ async def create_message(
         dream_id=dream_id,
         role=role,
         content=content,
+        token_count=count_tokens(content),
     )
     db.add(msg)
+    await db.flush()
+    # Снапшот контекста обновляется в той же транзакции
+    await apply_message(db, msg)
     await db.commit()
     await db.refresh(msg)
     return msg
@@ -67,6 +82,30 @@ async def get_messages_for_dream(
     return messages, total
 
 
+def _rank_blocks(blocks: list[dict], current_block: dict | None) -> list[int]:
+    """
+    Порядок отбора блоков: текущий сон, затем по релевантности к нему,
+    при равной релевантности — более новые
+
+    Запрос — только текст сна, чтобы набор якорей не менялся от follow-up
+    к follow-up. Вызывается в потоке: на больших журналах оценка занимает
+    заметное время.
+
+    Returns:
+        Индексы blocks в порядке отбора
+    """
+    query = current_block["terms"] if current_block else {}
+    documents = [
+        b["terms"] if "terms" in b else term_frequencies(b["search_text"])
+        for b in blocks
+    ]
+    scores = bm25_scores(query, documents)
+    return sorted(
+        range(len(blocks)),
+        key=lambda i: (blocks[i] is not current_block, -scores[i], -i),
+    )
+
+
 async def build_llm_context(
     db: AsyncSession,
     user_id: UUID,
@@ -76,66 +115,70 @@ async def build_llm_context(
     """
     Собрать полный контекст для LLM.
 
-    Структура:
+    Структура (только дописывается в конец, чтобы соседние запросы
+    пользователя имели общий побайтный префикс для prompt-кэша провайдера):
     1. system — системный промпт
-    2. Якорные сообщения: для КАЖДОГО сна — первое user-сообщение (текст сна)
-       + первый assistant-ответ (анализ), с префиксом [Сон: дата]
-    3. Последние N сообщений follow-up диалога по текущему сну
-    4. Если бюджет превышен — обрезаем старые не-якорные сообщения
+    2. Стабильный блок: для каждого прошлого сна — первое user-сообщение
+       (текст сна) + первый assistant-ответ (анализ), с префиксом [Сон от дата],
+       в хронологическом порядке. Берутся из UserContextSnapshot, который
+       поддерживает create_message. Старые сны заменяются сводками за
+       месяц/квартал (ContextSummary)
+    3. Текущий сон с префиксом [Текущий сон от дата] и его анализ
+    4. Последние N сообщений follow-up диалога по текущему сну
+    Если бюджет превышен — текущий сон сохраняется, прошлые якоря отбираются
+    по BM25-релевантности к текущему сну (при равенстве — новые); частоты
+    термов якорей хранятся в снапшоте, оценка идёт вне event loop.
+    Статистика совпадения префикса с прошлым промптом пишется в снапшот.
     """
     messages: list[dict] = [{"role": "system", "text": system_prompt}]
 
-    # --- Якорные сообщения: все сны пользователя ---
-    dreams_q = (
-        select(Dream)
-        .where(Dream.user_id == user_id)
-        .order_by(Dream.created_at.asc())
-    )
-    dreams_result = await db.execute(dreams_q)
-    all_dreams = list(dreams_result.scalars().all())
-
-    anchor_messages: list[dict] = []
-    for dream in all_dreams:
-        # Первое user-сообщение по этому сну
-        first_user_q = (
-            select(AnalysisMessage)
-            .where(
-                AnalysisMessage.user_id == user_id,
-                AnalysisMessage.dream_id == dream.id,
-                AnalysisMessage.role == MessageRole.USER.value,
+    # --- Якорные блоки: из снапшота пользователя (одно чтение) ---
+    snapshot = await get_snapshot(db, user_id)
+    summaries = await get_summaries(db, user_id)
+    current_key = str(current_dream_id)
+    now = datetime.utcnow()
+
+    # Блок — сообщения одного сна (или одной сводки), которые берутся целиком:
+    # {"messages", "tokens" (по сообщениям), "terms"} — у якорей частоты термов
+    # из снапшота, у сводок вместо них "search_text".
+    # Токены якорей и сводок посчитаны заранее
+    blocks: list[dict] = []
+    current_block: dict | None = None
+    used_summaries: set[str] = set()
+    for anchor in snapshot.anchors:
+        is_current = anchor["dream_id"] == current_key
+
+        # Старые сны заменяются сводкой периода, если она уже готова
+        if not is_current:
+            summary = next(
+                (summaries[p] for p in summary_periods(anchor["created_at"], now) if p in summaries),
+                None,
             )
-            .order_by(AnalysisMessage.created_at.asc())
-            .limit(1)
-        )
-        first_user = (await db.execute(first_user_q)).scalar_one_or_none()
-
-        # Первое assistant-сообщение
-        first_asst_q = (
-            select(AnalysisMessage)
-            .where(
-                AnalysisMessage.user_id == user_id,
-                AnalysisMessage.dream_id == dream.id,
-                AnalysisMessage.role == MessageRole.ASSISTANT.value,
-            )
-            .order_by(AnalysisMessage.created_at.asc())
-            .limit(1)
-        )
-        first_asst = (await db.execute(first_asst_q)).scalar_one_or_none()
-
-        date_str = dream.created_at.strftime("%d.%m.%Y")
-        is_current = dream.id == current_dream_id
-
-        if first_user:
+            if summary:
+                if summary.period not in used_summaries:
+                    used_summaries.add(summary.period)
+                    label = summary_label(summary.period)
+                    blocks.append({
+                        "messages": [{"role": "user", "text": f"{label}\n{summary.content}"}],
+                        "tokens": [count_tokens(f"{label}\n") + summary.token_count + MESSAGE_OVERHEAD_TOKENS],
+                        "search_text": summary.content,
+                    })
+                continue
+
+        date_str = datetime.fromisoformat(anchor["created_at"]).strftime("%d.%m.%Y")
+        block = {"messages": [], "tokens": [], "terms": anchor["terms"]}
+        if anchor["user"] is not None:
             prefix = f"[Сон от {date_str}]" if not is_current else f"[Текущий сон от {date_str}]"
-            anchor_messages.append({
-                "role": "user",
-                "text": f"{prefix}\n{first_user.content}",
-            })
-        if first_asst:
-            anchor_messages.append({
-                "role": "assistant",
-                "text": first_asst.content,
-            })
+            block["messages"].append({"role": "user", "text": f"{prefix}\n{anchor['user']}"})
+            block["tokens"].append(count_tokens(f"{prefix}\n") + anchor["user_tokens"] + MESSAGE_OVERHEAD_TOKENS)
+        if anchor["assistant"] is not None:
+            block["messages"].append({"role": "assistant", "text": anchor["assistant"]})
+            block["tokens"].append(anchor["assistant_tokens"] + MESSAGE_OVERHEAD_TOKENS)
+        if not block["messages"]:
+            continue
+        blocks.append(block)
+        if is_current:
+            current_block = block
 
     # --- Follow-up сообщения текущего сна (кроме первого user + первого assistant) ---
     all_current_q = (
@@ -152,6 +195,7 @@ async def build_llm_context(
     skip_user = True
     skip_asst = True
     follow_up: list[dict] = []
+    follow_up_tokens: list[int] = []
     for msg in all_current:
         if skip_user and msg.role == MessageRole.USER.value:
             skip_user = False
@@ -160,34 +204,48 @@ async def build_llm_context(
             skip_asst = False
             continue
         follow_up.append({"role": msg.role, "text": msg.content})
+        follow_up_tokens.append(message_tokens(msg) + MESSAGE_OVERHEAD_TOKENS)
 
     # Обрезаем follow-up до последних N
     if len(follow_up) > MAX_RECENT_MESSAGES:
         follow_up = follow_up[-MAX_RECENT_MESSAGES:]
+        follow_up_tokens = follow_up_tokens[-MAX_RECENT_MESSAGES:]
 
     # --- Сборка с учётом бюджета ---
     # system prompt не обрезаем
-    system_chars = len(system_prompt)
-    budget_remaining = CONTEXT_CHAR_BUDGET - system_chars
-
-    # follow-up имеют приоритет — считаем их размер
-    follow_up_chars = sum(len(m["text"]) for m in follow_up)
-    budget_for_anchors = budget_remaining - follow_up_chars
-
-    # Если якоря не влезают — обрезаем самые старые (но сохраняем текущий сон)
-    trimmed_anchors: list[dict] = []
-    used_chars = 0
-    # Проходим с конца (новые сны приоритетнее)
-    for msg in reversed(anchor_messages):
-        msg_chars = len(msg["text"])
-        if used_chars + msg_chars <= budget_for_anchors:
-            trimmed_anchors.insert(0, msg)
-            used_chars += msg_chars
-        else:
-            # Если не влезает — пропускаем старые
-            continue
-
-    messages.extend(trimmed_anchors)
+    system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    budget_remaining = CONTEXT_TOKEN_BUDGET - REPLY_PRIMING_TOKENS - system_tokens
+
+    # follow-up имеют приоритет — самые старые из них отбрасываем,
+    # если даже без якорей они не влезают в окно
+    while follow_up and sum(follow_up_tokens) > budget_remaining:
+        follow_up.pop(0)
+        follow_up_tokens.pop(0)
+    budget_for_anchors = budget_remaining - sum(follow_up_tokens)
+
+    block_tokens = [sum(b["tokens"]) for b in blocks]
+    if sum(block_tokens) <= budget_for_anchors:
+        # Всё влезает — ранжировать нечего
+        selected = set(range(len(blocks)))
+    else:
+        ranked = await asyncio.to_thread(_rank_blocks, blocks, current_block)
+        selected = set()
+        used_tokens = 0
+        for i in ranked:
+            if used_tokens + block_tokens[i] <= budget_for_anchors:
+                selected.add(i)
+                used_tokens += block_tokens[i]
+
+    tokens: list[int] = [system_tokens]
+    # Прошлые сны — в хронологическом порядке, текущий — после них
+    ordered = [i for i in sorted(selected) if blocks[i] is not current_block]
+    ordered += [i for i in selected if blocks[i] is current_block]
+    for i in ordered:
+        messages.extend(blocks[i]["messages"])
+        tokens.extend(blocks[i]["tokens"])
     messages.extend(follow_up)
+    tokens.extend(follow_up_tokens)
+
+    await record_prompt(db, snapshot, messages, tokens)
 
     return messages
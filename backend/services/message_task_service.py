@@ -1,11 +1,17 @@
 """Service for message task status."""
 
+from uuid import UUID
+
 from celery.result import AsyncResult
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from celery_app import celery_app
+from models import AnalysisMessage, User
 
 
-def get_message_task_status(task_id: str) -> dict:
+async def get_message_task_status(db: AsyncSession, task_id: str, user: User) -> dict:
+    """Task status; the reply text is read from analysis_messages, not the result backend."""
     task_result = AsyncResult(task_id, app=celery_app)
 
     status_dict = {
@@ -17,7 +23,18 @@ def get_message_task_status(task_id: str) -> dict:
 
     if task_result.ready():
         if task_result.successful():
-            status_dict["result"] = task_result.result
+            payload = task_result.result
+            if isinstance(payload, dict) and payload.get("message_id"):
+                result = await db.execute(
+                    select(AnalysisMessage.content).where(
+                        AnalysisMessage.id == UUID(payload["message_id"]),
+                        AnalysisMessage.user_id == user.id,
+                    )
+                )
+                status_dict["result"] = result.scalar_one_or_none()
+            elif isinstance(payload, str):
+                # Tasks queued before the switch to message_id stored the reply text itself
+                status_dict["result"] = payload
         elif task_result.failed():
             status_dict["error"] = str(task_result.info)
 
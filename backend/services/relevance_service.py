@@ -0,0 +1,107 @@
+"""Лексическое ранжирование снов по релевантности (BM25, без внешних сервисов)"""
+
+import math
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+import snowballstemmer
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Слова короче не учитываются (предлоги, союзы)
+MIN_TERM_LENGTH = 3
+# Словарь журнала снов невелик — основы слов запоминаются
+STEM_CACHE_SIZE = 65536
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+# Стеммеры Snowball отсекают окончания, чтобы "змея"/"змеи"/"змеёй" совпадали.
+# Объект стеммера хранит состояние разбора, а ранжирование идёт в потоках
+# (asyncio.to_thread) — обращения к нему сериализуются
+_RUSSIAN_STEMMER = snowballstemmer.stemmer("russian")
+_ENGLISH_STEMMER = snowballstemmer.stemmer("english")
+_STEMMER_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def _stem(word: str) -> str:
+    stemmer = _RUSSIAN_STEMMER if _CYRILLIC_RE.search(word) else _ENGLISH_STEMMER
+    with _STEMMER_LOCK:
+        return stemmer.stemWord(word)
+
+
+def extract_terms(text: str) -> list[str]:
+    """
+    Разбить текст на нормализованные термы
+
+    Args:
+        text: Текст
+
+    Returns:
+        Список термов (нижний регистр, ё→е, основа слова по Snowball)
+    """
+    terms: list[str] = []
+    for word in _WORD_RE.findall(text.lower().replace("ё", "е")):
+        if len(word) < MIN_TERM_LENGTH or word.isdigit():
+            continue
+        terms.append(_stem(word))
+    return terms
+
+
+def term_frequencies(text: str) -> dict[str, int]:
+    """
+    Частоты термов текста (хранятся в якорях снапшота контекста)
+
+    Args:
+        text: Текст
+
+    Returns:
+        Словарь терм -> количество вхождений
+    """
+    return dict(Counter(extract_terms(text)))
+
+
+def bm25_scores(query_terms: dict[str, int], documents: list[dict[str, int]]) -> list[float]:
+    """
+    Оценить документы относительно запроса по BM25
+
+    Корпус — только переданные документы (сны одного пользователя).
+    Документы и запрос передаются готовыми частотами термов
+    (term_frequencies), чтобы тексты не разбирались при каждой оценке.
+
+    Args:
+        query_terms: Частоты термов запроса (текущий сон)
+        documents: Частоты термов документов
+
+    Returns:
+        Оценки в порядке documents
+    """
+    if not documents:
+        return []
+    if not query_terms:
+        return [0.0] * len(documents)
+
+    n_docs = len(documents)
+    doc_lengths = [sum(tf.values()) for tf in documents]
+    avg_len = sum(doc_lengths) / n_docs or 1.0
+
+    idf: dict[str, float] = {}
+    for term in query_terms:
+        df = sum(1 for tf in documents if term in tf)
+        idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    scores: list[float] = []
+    for tf, doc_len in zip(documents, doc_lengths):
+        score = 0.0
+        for term in query_terms:
+            freq = tf.get(term)
+            if not freq:
+                continue
+            norm = freq + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg_len)
+            score += idf[term] * freq * (BM25_K1 + 1) / norm
+        scores.append(score)
+    return scores
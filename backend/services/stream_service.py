@@ -0,0 +1,82 @@
+"""Сервис стриминга ответов LLM клиенту (Server-Sent Events)"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+from uuid import UUID
+
+from llm_client import llm_client
+
+logger = logging.getLogger(__name__)
+
+# Ссылки на фоновые генерации, чтобы их не собрал GC до завершения
+_background_tasks: set[asyncio.Task] = set()
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Одно событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def stream_completion(
+    llm_messages: list[dict],
+    user_id: UUID,
+    on_complete: Callable[[str, dict], Awaitable[dict]],
+    on_error: Callable[[Exception], Awaitable[None]],
+) -> AsyncIterator[str]:
+    """
+    Стримить ответ LLM в виде SSE-событий
+
+    Генерация идёт в отдельной задаче: если клиент отключится,
+    ответ всё равно будет получен целиком и сохранён через on_complete.
+
+    События:
+    - delta: {"text": фрагмент ответа}
+    - done: результат on_complete
+    - error: {"detail": описание ошибки}
+
+    Args:
+        llm_messages: Контекст для LLM [{role, text}, ...]
+        user_id: ID пользователя (для очереди LLM Service)
+        on_complete: Сохранение полного текста и usage (в своей сессии БД)
+        on_error: Обработка ошибки генерации (в своей сессии БД)
+
+    Yields:
+        SSE-события
+    """
+    queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue()
+
+    async def produce():
+        parts: list[str] = []
+        usage: dict = {}
+        try:
+            async for delta in llm_client.chat_completion_stream(
+                messages=llm_messages, user_id=user_id, usage=usage
+            ):
+                parts.append(delta)
+                queue.put_nowait(("delta", {"text": delta}))
+
+            result_text = "".join(parts).strip()
+            if not result_text:
+                raise ValueError("Empty result from LLM Service stream")
+
+            queue.put_nowait(("done", await on_complete(result_text, usage)))
+
+        except Exception as e:
+            logger.error(f"LLM stream failed: {e}")
+            try:
+                await on_error(e)
+            except Exception as handler_error:
+                logger.error(f"Failed to handle LLM stream error: {handler_error}")
+            queue.put_nowait(("error", {"detail": "Failed to generate response"}))
+
+    task = asyncio.create_task(produce())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    while True:
+        event, data = await queue.get()
+        yield sse_event(event, data)
+        if event != "delta":
+            break
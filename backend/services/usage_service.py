@@ -0,0 +1,124 @@
+"""Сервис учёта расхода токенов LLM и дневных квот"""
+
+import logging
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import pytz
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import TokenUsage, UsageFeature, User
+from services.dream_service import get_user_timezone
+
+logger = logging.getLogger(__name__)
+
+
+def add_usage(total: dict, usage: dict) -> None:
+    """
+    Прибавить usage одного вызова к накопленному
+
+    Args:
+        total: Накопленный usage (изменяется на месте)
+        usage: Usage вызова {prompt_tokens, completion_tokens}
+    """
+    for key in ("prompt_tokens", "completion_tokens"):
+        total[key] = total.get(key, 0) + (usage.get(key) or 0)
+
+
+async def record_usage(
+    db: AsyncSession,
+    user_id: UUID,
+    feature: UsageFeature,
+    usage: dict,
+    dream_id: UUID | None = None,
+) -> TokenUsage | None:
+    """
+    Записать расход токенов в журнал
+
+    Вызовы без расхода (ответ из кэша LLM Service) не записываются.
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        feature: На что потрачены токены
+        usage: {prompt_tokens, completion_tokens} из ответа LLM Service
+        dream_id: ID сна (опционально)
+
+    Returns:
+        Запись журнала или None
+    """
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    if not prompt_tokens and not completion_tokens:
+        return None
+
+    entry = TokenUsage(
+        user_id=user_id,
+        dream_id=dream_id,
+        feature=feature.value,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+    db.add(entry)
+    await db.commit()
+
+    logger.info(f"User {user_id} spent {entry.total_tokens} tokens on {feature.value}")
+    return entry
+
+
+async def count_tokens_today(db: AsyncSession, user: User) -> int:
+    """
+    Подсчитать токены, потраченные пользователем за сегодня (в его timezone)
+
+    Фоновые сводки контекста (UsageFeature.SUMMARY) пользователь не
+    запускает сам, поэтому в квоту они не входят.
+
+    Args:
+        db: Сессия базы данных
+        user: Пользователь
+
+    Returns:
+        Сумма total_tokens за сегодня без фоновых сводок
+    """
+    user_tz = await get_user_timezone(user)
+    start_of_day = datetime.now(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
+    start_of_day_utc = start_of_day.astimezone(pytz.UTC)
+    end_of_day_utc = (start_of_day + timedelta(days=1)).astimezone(pytz.UTC)
+
+    result = await db.execute(
+        select(func.coalesce(func.sum(TokenUsage.total_tokens), 0)).where(
+            TokenUsage.user_id == user.id,
+            TokenUsage.created_at >= start_of_day_utc,
+            TokenUsage.created_at < end_of_day_utc,
+            TokenUsage.feature != UsageFeature.SUMMARY.value,
+        )
+    )
+    return int(result.scalar_one())
+
+
+async def check_token_quota(db: AsyncSession, user: User) -> bool:
+    """
+    Проверить, не исчерпана ли дневная квота токенов
+
+    Проверка идёт до постановки задачи: запрос, начатый в пределах квоты,
+    выполняется целиком, даже если по итогу квота будет превышена.
+
+    Args:
+        db: Сессия базы данных
+        user: Пользователь
+
+    Returns:
+        True если квота не исчерпана (или квоты нет)
+    """
+    limit = settings.llm_tokens_per_day_limit
+    if not limit:
+        return True
+
+    tokens_today = await count_tokens_today(db, user)
+    if tokens_today >= limit:
+        logger.info(f"User {user.id} exceeded daily token quota: {tokens_today}/{limit}")
+        return False
+    return True
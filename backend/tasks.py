@@ -2,21 +2,54 @@
 
 import logging
 import asyncio
-from datetime import datetime
+import threading
 from uuid import UUID
 
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+
 from celery_app import celery_app
-from database import AsyncSessionLocal
-from models import Analysis, Dream, User, AnalysisStatus, MessageRole
+from database import AsyncSessionLocal, engine
+from models import Analysis, Dream, User, AnalysisStatus, MessageRole, UsageFeature
 from llm_client import llm_client
+from services.event_service import event_bus, ANALYSIS_READY, REPLY_READY
 from sqlalchemy import select
+from tokenizer import get_tokenizer
 
 logger = logging.getLogger(__name__)
 _worker_loop: asyncio.AbstractEventLoop | None = None
+# Общий loop для пула threads: крутится в отдельном потоке, задачи всех потоков идут в нём
+_shared_loop: asyncio.AbstractEventLoop | None = None
+_shared_loop_thread: threading.Thread | None = None
+_shared_loop_lock = threading.Lock()
+
+
+def _get_shared_loop() -> asyncio.AbstractEventLoop:
+    """Запустить (при первом вызове) общий event loop в фоновом потоке"""
+    global _shared_loop, _shared_loop_thread
+    with _shared_loop_lock:
+        if _shared_loop is None or _shared_loop.is_closed():
+            _shared_loop = asyncio.new_event_loop()
+            _shared_loop_thread = threading.Thread(
+                target=_shared_loop.run_forever, name="celery-asyncio-loop", daemon=True
+            )
+            _shared_loop_thread.start()
+            logger.info("Started shared asyncio loop for the threads pool")
+        return _shared_loop
 
 
 def _run_in_worker_loop(coro):
-    """Reuse a single event loop per Celery worker process to avoid cross-loop asyncpg usage."""
+    """
+    Выполнить корутину задачи в event loop воркера
+
+    prefork/solo: один loop на процесс, задача блокирует процесс до конца.
+    threads (celery worker --pool threads --concurrency N): корутины всех
+    потоков выполняются конкурентно в одном общем loop, поток лишь ждёт
+    результат, поэтому один процесс держит N ожидающих LLM задач с общими
+    пулами БД и HTTP.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return asyncio.run_coroutine_threadsafe(coro, _get_shared_loop()).result()
+
     global _worker_loop
     if _worker_loop is None or _worker_loop.is_closed():
         _worker_loop = asyncio.new_event_loop()
@@ -24,25 +57,96 @@ def _run_in_worker_loop(coro):
     return _worker_loop.run_until_complete(coro)
 
 
+@worker_init.connect
+@worker_process_init.connect
+def _preload_tokenizer(**kwargs):
+    """
+    Загрузить токенизатор при старте воркера, а не в первой задаче
+
+    Иначе первый count_tokens качает его с HuggingFace Hub прямо в event
+    loop и останавливает все задачи общего loop пула threads. worker_init
+    срабатывает в главном процессе (threads/solo, дочерние процессы prefork
+    наследуют загруженный токенизатор), worker_process_init — в каждом
+    дочернем процессе prefork.
+    """
+    get_tokenizer()
+
+
+async def _close_resources() -> None:
+    await llm_client.aclose()
+    await event_bus.aclose()
+    await engine.dispose()
+
+
+@worker_process_shutdown.connect
+def _close_worker_resources(**kwargs):
+    """Закрыть HTTP-клиент LLM Service, Redis событий и пул БД в loop воркера при остановке процесса"""
+    if _worker_loop is None or _worker_loop.is_closed():
+        return
+    try:
+        _worker_loop.run_until_complete(_close_resources())
+    except Exception as e:
+        logger.warning(f"Failed to close worker resources: {e}")
+    finally:
+        _worker_loop.close()
+
+
+@worker_shutdown.connect
+def _close_shared_loop(**kwargs):
+    """Закрыть ресурсы и остановить общий loop пула threads"""
+    if _shared_loop is None or _shared_loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_resources(), _shared_loop).result(timeout=30)
+    except Exception as e:
+        logger.warning(f"Failed to close worker resources: {e}")
+    finally:
+        _shared_loop.call_soon_threadsafe(_shared_loop.stop)
+        _shared_loop_thread.join(timeout=5)
+        _shared_loop.close()
+
+
+async def _notify(user_id: UUID | str, event_type: str, task_id: str | None, **fields) -> None:
+    """Сообщить клиентам пользователя о завершении задачи (WebSocket /events/ws)"""
+    await event_bus.publish(user_id, {
+        "type": event_type,
+        "task_id": task_id,
+        **fields,
+    })
+
+
 @celery_app.task(bind=True, name="tasks.analyze_dream")
-def analyze_dream_task(self, analysis_id: str):
+def analyze_dream_task(self, analysis_id: str, generation: int | None = None):
     """
     Фоновая задача для анализа сна
 
     Args:
         self: Celery task instance
         analysis_id: UUID анализа
+        generation: Поколение анализа на момент постановки задачи
+            (None — задача поставлена до появления поколений)
     """
     # Запускаем асинхронную функцию в event loop
-    return _run_in_worker_loop(_analyze_dream_async(self, analysis_id))
+    # request — thread-local Celery: в общем loop пула threads он уже недоступен
+    return _run_in_worker_loop(_analyze_dream_async(self.request.id, analysis_id, generation))
 
 
-async def _analyze_dream_async(task_instance, analysis_id: str):
+async def _analyze_dream_async(task_id: str | None, analysis_id: str, generation: int | None = None):
     """
     Асинхронная функция для анализа сна.
     Создаёт user-сообщение, собирает контекст, вызывает LLM, сохраняет assistant-сообщение.
+
+    Если анализ перезапрошен (поколение сменилось), задача завершается без
+    вызова LLM или без сохранения результата — их выполнит новая задача.
     """
-    from services.message_service import create_message, build_llm_context
+    from services.analysis_service import (
+        complete_analysis,
+        create_analysis_user_message,
+        fail_analysis,
+        is_analysis_current,
+    )
+    from services.message_service import build_llm_context
+    from services.usage_service import record_usage
 
     async with AsyncSessionLocal() as db:
         try:
@@ -56,6 +160,12 @@ async def _analyze_dream_async(task_instance, analysis_id: str):
                 logger.error(f"Analysis {analysis_id} not found")
                 return None
 
+            if generation is None:
+                generation = analysis.generation
+            elif analysis.generation != generation:
+                logger.info(f"Analysis {analysis_id} generation {generation} superseded, skipping")
+                return None
+
             # Обновляем статус на "processing"
             analysis.status = AnalysisStatus.PROCESSING.value
             await db.commit()
@@ -68,9 +178,7 @@ async def _analyze_dream_async(task_instance, analysis_id: str):
 
             if not dream:
                 logger.error(f"Dream {analysis.dream_id} not found")
-                analysis.status = AnalysisStatus.FAILED.value
-                analysis.error_message = "Dream not found"
-                await db.commit()
+                await fail_analysis(db, analysis.id, generation, "Dream not found")
                 return None
 
             # Получаем пользователя для настроек
@@ -81,21 +189,16 @@ async def _analyze_dream_async(task_instance, analysis_id: str):
 
             if not user:
                 logger.error(f"User {analysis.user_id} not found")
-                analysis.status = AnalysisStatus.FAILED.value
-                analysis.error_message = "User not found"
-                await db.commit()
+                await fail_analysis(db, analysis.id, generation, "User not found")
                 return None
 
             logger.info(f"Starting analysis {analysis_id} for dream {dream.id}")
 
-            # Создаём user-сообщение (текст сна) в analysis_messages
-            await create_message(
-                db,
-                user_id=user.id,
-                dream_id=dream.id,
-                role=MessageRole.USER.value,
-                content=dream.content,
-            )
+            # Создаём user-сообщение (текст сна) в analysis_messages, если анализ
+            # не сброшен: сброс удаляет сообщения сна, писать в новый чат нельзя
+            if not await create_analysis_user_message(db, analysis.id, generation, dream.content):
+                logger.info(f"Analysis {analysis_id} generation {generation} superseded, skipping")
+                return None
 
             # Собираем контекст для LLM
             from prompts import get_chat_system_prompt
@@ -108,50 +211,66 @@ async def _analyze_dream_async(task_instance, analysis_id: str):
                 system_prompt=system_prompt,
             )
 
+            # Последняя проверка перед дорогим вызовом LLM
+            if not await is_analysis_current(db, analysis.id, generation):
+                logger.info(f"Analysis {analysis_id} generation {generation} superseded before LLM call")
+                return None
+
+            # Возвращаем соединение в пул БД на время ожидания LLM
+            await db.commit()
+
             # Отправляем запрос в LLM Service
             try:
-                result_text = await llm_client.chat_completion(messages=llm_messages)
-
-                # Сохраняем assistant-сообщение в analysis_messages
-                await create_message(
-                    db,
-                    user_id=user.id,
-                    dream_id=dream.id,
-                    role=MessageRole.ASSISTANT.value,
-                    content=result_text,
+                usage: dict = {}
+                result_text = await llm_client.chat_completion(
+                    messages=llm_messages, user_id=user.id, usage=usage
                 )
-
-                # Backward compat: записываем результат в Analysis.result
-                analysis.result = result_text
-                analysis.status = AnalysisStatus.COMPLETED.value
-                analysis.completed_at = datetime.utcnow()
-
-                await db.commit()
-
-                logger.info(f"Analysis {analysis_id} completed successfully")
-                return result_text
-
             except Exception as e:
                 logger.error(f"LLM Service error for analysis {analysis_id}: {e}")
-                analysis.status = AnalysisStatus.FAILED.value
-                analysis.error_message = f"LLM Service error: {str(e)}"
-                await db.commit()
                 raise
 
+            # Assistant-сообщение и статус сохраняются, только если анализ не перезапрошен
+            saved = await complete_analysis(db, analysis.id, generation, result_text)
+            # Токены потрачены в любом случае
+            await record_usage(db, user.id, UsageFeature.ANALYSIS, usage, dream.id)
+            if not saved:
+                return None
+
+            logger.info(f"Analysis {analysis_id} completed successfully")
+            await _notify(
+                user.id, ANALYSIS_READY, task_id,
+                status=AnalysisStatus.COMPLETED.value,
+                analysis_id=analysis_id,
+                dream_id=dream.id,
+            )
+            # Новый якорь мог изменить старые периоды — досжимаем в фоне
+            summarize_context_task.delay(str(user.id))
+            # В result backend — только статус; текст читается из БД
+            return {
+                "analysis_id": analysis_id,
+                "dream_id": str(dream.id),
+                "status": AnalysisStatus.COMPLETED.value,
+            }
+
         except Exception as e:
             logger.error(f"Failed to analyze dream {analysis_id}: {e}")
 
-            # Обновляем статус на failed
+            # Обновляем статус на failed (если анализ не перезапрошен)
             try:
+                await db.rollback()
                 result = await db.execute(
                     select(Analysis).where(Analysis.id == UUID(analysis_id))
                 )
                 analysis = result.scalar_one_or_none()
 
-                if analysis:
-                    analysis.status = AnalysisStatus.FAILED.value
-                    analysis.error_message = str(e)
-                    await db.commit()
+                if analysis and generation is not None and await fail_analysis(db, analysis.id, generation, str(e)):
+                    await _notify(
+                        analysis.user_id, ANALYSIS_READY, task_id,
+                        status=AnalysisStatus.FAILED.value,
+                        analysis_id=analysis_id,
+                        dream_id=analysis.dream_id,
+                        error=str(e),
+                    )
             except:
                 pass
 
@@ -166,12 +285,13 @@ def reply_to_dream_chat_task(self, user_id: str, dream_id: str):
     User-сообщение уже сохранено в analysis_messages (в API-хэндлере).
     Эта задача собирает контекст, вызывает LLM, сохраняет assistant-сообщение.
     """
-    return _run_in_worker_loop(_reply_to_dream_chat_async(self, user_id, dream_id))
+    return _run_in_worker_loop(_reply_to_dream_chat_async(self.request.id, user_id, dream_id))
 
 
-async def _reply_to_dream_chat_async(task_instance, user_id: str, dream_id: str):
+async def _reply_to_dream_chat_async(task_id: str | None, user_id: str, dream_id: str):
     """Асинхронная реализация ответа на follow-up."""
     from services.message_service import create_message, build_llm_context
+    from services.usage_service import record_usage
 
     async with AsyncSessionLocal() as db:
         try:
@@ -195,11 +315,17 @@ async def _reply_to_dream_chat_async(task_instance, user_id: str, dream_id: str)
                 system_prompt=system_prompt,
             )
 
+            # Возвращаем соединение в пул БД на время ожидания LLM
+            await db.commit()
+
             # Вызываем LLM
-            result_text = await llm_client.chat_completion(messages=llm_messages)
+            usage: dict = {}
+            result_text = await llm_client.chat_completion(
+                messages=llm_messages, user_id=user_id, usage=usage
+            )
 
             # Сохраняем assistant-сообщение
-            await create_message(
+            message = await create_message(
                 db,
                 user_id=UUID(user_id),
                 dream_id=UUID(dream_id),
@@ -207,15 +333,52 @@ async def _reply_to_dream_chat_async(task_instance, user_id: str, dream_id: str)
                 content=result_text,
             )
 
+            await record_usage(db, UUID(user_id), UsageFeature.CHAT, usage, UUID(dream_id))
+
             logger.info(f"Chat reply saved for dream {dream_id}")
-            return result_text
+            await _notify(
+                user_id, REPLY_READY, task_id,
+                status="completed",
+                dream_id=dream_id,
+                message_id=message.id,
+            )
+            # В result backend — только статус; текст читается из БД
+            return {"dream_id": dream_id, "message_id": str(message.id), "status": "completed"}
 
         except Exception as e:
             logger.error(f"Failed to reply in dream chat {dream_id}: {e}")
+            await _notify(
+                user_id, REPLY_READY, task_id,
+                status="failed",
+                dream_id=dream_id,
+                error=str(e),
+            )
+            raise
+
+
+@celery_app.task(bind=True, name="tasks.summarize_context", ignore_result=True)
+def summarize_context_task(self, user_id: str):
+    """
+    Фоновая задача для обновления сводок старых снов пользователя.
+
+    LLM вызывается только для месяцев/кварталов, сны которых изменились.
+    """
+    return _run_in_worker_loop(_summarize_context_async(user_id))
+
+
+async def _summarize_context_async(user_id: str):
+    """Асинхронная реализация обновления сводок."""
+    from services.context_summary_service import refresh_summaries
+
+    async with AsyncSessionLocal() as db:
+        try:
+            await refresh_summaries(db, UUID(user_id))
+        except Exception as e:
+            logger.error(f"Failed to summarize context for user {user_id}: {e}")
             raise
 
 
-@celery_app.task(name="tasks.send_email_task")
+@celery_app.task(name="tasks.send_email_task", ignore_result=True)
 def send_email_task(to: str, subject: str, body: str):
     """
     Фоновая задача для отправки email
@@ -0,0 +1,54 @@
+"""Подсчёт токенов для бюджета LLM-контекста"""
+
+import logging
+import os
+from functools import lru_cache
+
+from tokenizers import Tokenizer
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer() -> Tokenizer | None:
+    """
+    Загрузить токенизатор модели один раз на процесс
+
+    settings.llm_tokenizer — путь к tokenizer.json или ID модели на HuggingFace Hub.
+
+    Returns:
+        Токенизатор или None, если загрузить не удалось
+    """
+    name = settings.llm_tokenizer
+    try:
+        if os.path.isfile(name):
+            return Tokenizer.from_file(name)
+        return Tokenizer.from_pretrained(name)
+    except Exception as e:
+        logger.warning(f"Failed to load tokenizer {name}, using byte-based estimate: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Посчитать токены текста токенизатором модели
+
+    Без токенизатора используется оценка сверху: половина длины в UTF-8
+    байтах (для кириллицы — токен на символ), чтобы промпт не превысил окно.
+
+    Args:
+        text: Текст
+
+    Returns:
+        Количество токенов
+    """
+    if not text:
+        return 0
+
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text.encode("utf-8")) // 2 + 1
+
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
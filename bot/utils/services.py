@@ -5,8 +5,9 @@ import emoji
 import logging
 
 from collections import Counter
+from functools import lru_cache
 from pydub import AudioSegment
-from yandex_cloud_ml_sdk import YCloudML
+from yandex_cloud_ml_sdk import AsyncYCloudML
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +66,18 @@ def voice_to_text(file_path):
         return "Ошибка запроса к сервису распознавания"
     
 
+@lru_cache(maxsize=None)
+def _yandex_sdk(folder_id: str, api_key: str) -> AsyncYCloudML:
+    """Один асинхронный клиент YandexGPT на процесс (на пару folder_id/api_key)"""
+    return AsyncYCloudML(folder_id=folder_id, auth=api_key)
+
+
+@lru_cache(maxsize=None)
+def _yandex_model(folder_id: str, api_key: str, temperature: float):
+    """Сконфигурированная модель yandexgpt, переиспользуется между вызовами"""
+    return _yandex_sdk(folder_id, api_key).models.completions("yandexgpt").configure(temperature=temperature)
+
+
 async def analyze_dreams(dreams_text: str,
                          intro_prompt: str,
                          temperature: float,
@@ -86,14 +99,7 @@ async def analyze_dreams(dreams_text: str,
 
     logger.info(intro_prompt)
 
-    sdk = YCloudML(
-        folder_id=folder_id,
-        auth=api_key,
-    )
-
-    result = (
-        sdk.models.completions("yandexgpt").configure(temperature=temperature).run(messages)
-    )
+    result = await _yandex_model(folder_id, api_key, temperature).run(messages)
 
     # Возвращаем первый вариант ответа
     return result[0] if result else "Анализ недоступен."
@@ -0,0 +1,221 @@
+"""
+Локальная замена Gonka Proxy: OpenAI-совместимый /v1/chat/completions
+
+Отвечает синтетическим текстом с настраиваемой латентностью и внедрением
+сбоев, чтобы гонять llm_service под нагрузкой без реального провайдера:
+- латентность до первого байта из распределения (--latency),
+  стриминг — по слову с задержкой --token-delay;
+- ошибки 502/503/504 (--error-rate, --error-statuses), 429 с Retry-After;
+- зависание до таймаута клиента (--timeout-rate), пустой content
+  (--empty-rate), обрыв стрима на середине (--stream-break-rate).
+
+Запуск из каталога llm_service:
+    python -m benchmarks.fake_openai --port 9000 \\
+        --latency lognormal:2,0.5 --error-rate 0.05 --timeout-rate 0.01
+
+и llm_service поверх него:
+    GONKA_BASE_URL=http://localhost:9000/v1 GONKA_API_KEY=fake uvicorn main:app --port 8001
+
+Распределения латентности (секунды): fixed:1, uniform:0.5,3,
+normal:2,0.5, lognormal:<медиана>,<sigma>, exp:<среднее>.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import AsyncIterator, Callable
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORDS = (
+    "сон символ тень анима анимус самость архетип образ вода дом лестница "
+    "дорога мать отец ребёнок зеркало дверь ключ свет тьма путь превращение "
+    "бессознательное сознание персона инстинкт желание страх встреча"
+).split()
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Сэмплер латентности из строки вида "lognormal:2,0.5"
+
+    Args:
+        spec: <распределение>:<параметры через запятую>
+
+    Returns:
+        Функция rng -> задержка в секундах (не меньше 0)
+
+    Raises:
+        ValueError: Неизвестное распределение или неверные параметры
+    """
+    kind, _, raw = spec.partition(":")
+    try:
+        params = [float(p) for p in raw.split(",") if p.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid latency parameters: {spec}")
+
+    samplers = {
+        "fixed": (1, lambda rng, v: v),
+        "uniform": (2, lambda rng, lo, hi: rng.uniform(lo, hi)),
+        "normal": (2, lambda rng, mu, sigma: rng.gauss(mu, sigma)),
+        # Медиана удобнее mu: lognormal:2,0.5 — половина ответов быстрее 2 с
+        "lognormal": (2, lambda rng, median, sigma: median * rng.lognormvariate(0, sigma)),
+        "exp": (1, lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0.0),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    arity, sample = samplers[kind]
+    if len(params) != arity:
+        raise ValueError(f"{kind} latency expects {arity} parameter(s), got {spec}")
+    return lambda rng: max(0.0, sample(rng, *params))
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:2,0.5", help="Задержка до первого байта, сек")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Задержка между словами в стриме, сек")
+    parser.add_argument("--completion-words", type=int, default=300, help="Слов в ответе")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с HTTP-ошибкой")
+    parser.add_argument("--error-statuses", default="502,503,504", help="Статусы ошибок через запятую")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After для 429/503, сек")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Доля запросов без ответа")
+    parser.add_argument("--hang", type=float, default=600.0, help="Сколько висит запрос без ответа, сек")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="Доля ответов с пустым content")
+    parser.add_argument("--stream-break-rate", type=float, default=0.0, help="Доля стримов, оборванных на середине")
+    parser.add_argument("--seed", type=int, help="Seed генератора (по умолчанию случайный)")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+    try:
+        args.sample_latency = parse_latency(args.latency)
+        args.statuses = [int(s) for s in args.error_statuses.split(",") if s.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def _count_tokens(text: str) -> int:
+    # Грубая оценка: ~4/3 токена на слово
+    return max(1, len(text.split()) * 4 // 3)
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    """Приложение фейкового провайдера с настройками из args"""
+    rng = random.Random(args.seed)
+    outcomes: Counter[str] = Counter()
+    app = FastAPI(title="Fake OpenAI-compatible LLM")
+
+    def choose_fault(stream: bool) -> str | None:
+        roll = rng.random()
+        for fault, rate in (
+            ("error", args.error_rate),
+            ("timeout", args.timeout_rate),
+            ("empty", args.empty_rate),
+            ("stream_break", args.stream_break_rate if stream else 0.0),
+        ):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    @app.get("/v1/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        """Сколько запросов завершилось каждым исходом"""
+        return dict(outcomes)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        model = body.get("model", "fake")
+        prompt_tokens = sum(_count_tokens(str(m.get("content", ""))) for m in body.get("messages", []))
+        fault = choose_fault(stream)
+
+        await asyncio.sleep(args.sample_latency(rng))
+
+        if fault == "timeout":
+            outcomes["timeout"] += 1
+            await asyncio.sleep(args.hang)
+        if fault == "error" and args.statuses:
+            status_code = rng.choice(args.statuses)
+            outcomes[str(status_code)] += 1
+            headers = {"Retry-After": str(args.retry_after)} if status_code in (429, 503) else None
+            return JSONResponse(
+                status_code=status_code,
+                content={"error": {"message": "Injected failure", "code": status_code}},
+                headers=headers,
+            )
+
+        words = [] if fault == "empty" else [rng.choice(_WORDS) for _ in range(args.completion_words)]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not stream:
+            outcomes[fault or "ok"] += 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        break_at = len(words) // 2 if fault == "stream_break" else None
+
+        def chunk(delta: dict, finish_reason: str | None = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def events() -> AsyncIterator[str]:
+            yield chunk({"role": "assistant"})
+            for i, word in enumerate(words):
+                if i == break_at:
+                    outcomes["stream_break"] += 1
+                    # Исключение в генераторе рвёт соединение без завершающего чанка
+                    raise ConnectionAbortedError("Injected stream break")
+                yield chunk({"content": word if i == 0 else f" {word}"})
+                await asyncio.sleep(args.token_delay)
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield f"data: {json.dumps({'id': completion_id, 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+            outcomes[fault or "ok"] += 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    args = _parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Генератор нагрузки на LLM Service: /chat и /analyze с заданным RPS
+
+Открытая модель нагрузки: запросы отправляются по расписанию (равномерно
+или пуассоновским потоком) независимо от того, успел ли сервис ответить,
+поэтому перегрузка видна как рост латентности и 429, а не как падение
+отправляемого RPS. Одновременных запросов не больше --max-in-flight —
+сверх этого приход считается отброшенным на стороне генератора.
+
+Отчёт — JSON (stdout или --output): пропускная способность, коды ответов,
+ошибки и перцентили латентности по эндпоинтам, плюс /queue, /cache и
+/providers сервиса после прогона.
+
+Запуск из каталога llm_service (сервис поверх benchmarks.fake_openai):
+    python -m benchmarks.loadgen --url http://localhost:8001 \\
+        --endpoint mix --rps 20 --duration 60 --clients 50 --output load.json
+
+По умолчанию каждый запрос уникален, чтобы кэш ответов не искажал замер;
+--repeat-ratio задаёт долю повторяющихся запросов для проверки кэша и
+объединения одинаковых запросов.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+import httpx
+
+CLIENT_ID_HEADER = "X-Client-Id"
+
+_WORDS = (
+    "змея дом лестница вода море мать отец лес дорога поезд окно дверь ключ "
+    "тень свет огонь птица волк река мост город башня зеркало ребёнок старик "
+    "школа экзамен падение полёт погоня тьма луна солнце сад храм пещера"
+).split()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Drive llm_service /chat and /analyze at a target RPS")
+    parser.add_argument("--url", default="http://localhost:8001", help="Адрес LLM Service")
+    parser.add_argument("--endpoint", choices=("chat", "analyze", "mix"), default="mix")
+    parser.add_argument("--chat-ratio", type=float, default=0.5, help="Доля /chat в режиме mix")
+    parser.add_argument("--rps", type=float, default=5.0, help="Целевая частота запросов")
+    parser.add_argument("--duration", type=float, default=60.0, help="Длительность подачи нагрузки, сек")
+    parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Предел одновременных запросов")
+    parser.add_argument("--clients", type=int, default=20, help="Разных X-Client-Id")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Доля одинаковых запросов")
+    parser.add_argument("--dream-words", type=int, default=120, help="Слов в тексте сна")
+    parser.add_argument("--history", type=int, default=4, help="Сообщений истории в /chat")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Таймаут одного запроса, сек")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Файл для JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+    if args.rps <= 0 or args.duration <= 0:
+        parser.error("--rps and --duration must be positive")
+    return args
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _payload(endpoint: str, rng: random.Random, args: argparse.Namespace) -> dict:
+    """Тело запроса; повторяющиеся запросы строятся из фиксированного seed"""
+    if rng.random() < args.repeat_ratio:
+        rng = random.Random(f"repeat-{endpoint}")
+
+    if endpoint == "analyze":
+        return {"dream_text": _text(rng, args.dream_words), "user_description": _text(rng, 15)}
+
+    messages = [
+        {"role": "system", "text": "Ты — аналитик снов в юнгианской традиции."},
+        {"role": "user", "text": _text(rng, args.dream_words)},
+    ]
+    for i in range(args.history):
+        role = "assistant" if i % 2 == 0 else "user"
+        messages.append({"role": role, "text": _text(rng, 60 if role == "assistant" else 15)})
+    if messages[-1]["role"] != "user":
+        messages.append({"role": "user", "text": _text(rng, 15)})
+    return {"messages": messages}
+
+
+def _percentiles(values: list[float]) -> dict | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+    return {
+        "mean": round(statistics.fmean(ordered), 1),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "min": round(ordered[0], 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+class EndpointStats:
+    """Результаты запросов к одному эндпоинту"""
+
+    def __init__(self):
+        self.sent = 0
+        self.statuses: Counter[str] = Counter()
+        self.latencies_ms: list[float] = []
+        self.error_latencies_ms: list[float] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, status: str, latency_ms: float, body: dict | None = None) -> None:
+        self.statuses[status] += 1
+        if status == "200":
+            self.latencies_ms.append(latency_ms)
+            usage = (body or {}).get("usage") or {}
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+        else:
+            self.error_latencies_ms.append(latency_ms)
+
+    def report(self, elapsed: float) -> dict:
+        ok = len(self.latencies_ms)
+        return {
+            "sent": self.sent,
+            "ok": ok,
+            "statuses": dict(self.statuses),
+            "success_ratio": round(ok / self.sent, 4) if self.sent else 0.0,
+            "throughput_rps": round(ok / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": _percentiles(self.latencies_ms),
+            "error_latency_ms": _percentiles(self.error_latencies_ms),
+            "tokens": {"prompt": self.prompt_tokens, "completion": self.completion_tokens},
+        }
+
+
+async def _send(
+    client: httpx.AsyncClient, endpoint: str, payload: dict, client_id: str, stats: EndpointStats
+) -> None:
+    started = time.perf_counter()
+    body = None
+    try:
+        response = await client.post(f"/{endpoint}", json=payload, headers={CLIENT_ID_HEADER: client_id})
+        status = str(response.status_code)
+        if response.status_code == 200:
+            body = response.json()
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    stats.record(status, (time.perf_counter() - started) * 1000, body)
+
+
+async def _service_snapshot(client: httpx.AsyncClient) -> dict:
+    """Состояние очереди, кэша и роутера сервиса (что удалось получить)"""
+    snapshot = {}
+    for path in ("queue", "cache", "providers"):
+        try:
+            response = await client.get(f"/{path}", timeout=10.0)
+            if response.status_code == 200:
+                snapshot[path] = response.json()
+        except httpx.HTTPError:
+            pass
+    return snapshot
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+async def main() -> None:
+    args = _parse_args()
+    rng = random.Random(args.seed)
+    endpoints = ["chat", "analyze"] if args.endpoint == "mix" else [args.endpoint]
+    stats = {endpoint: EndpointStats() for endpoint in endpoints}
+    dropped = 0
+    tasks: set[asyncio.Task] = set()
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=args.timeout, limits=limits) as client:
+        print(f"Sending {args.rps} rps to {args.url} for {args.duration}s...", file=sys.stderr)
+        started = time.perf_counter()
+        next_at = started
+        last_progress = started
+        while next_at - started < args.duration:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+            if args.endpoint == "mix":
+                endpoint = "chat" if rng.random() < args.chat_ratio else "analyze"
+            else:
+                endpoint = args.endpoint
+            if len(tasks) >= args.max_in_flight:
+                dropped += 1
+            else:
+                stats[endpoint].sent += 1
+                task = asyncio.create_task(_send(
+                    client, endpoint, _payload(endpoint, rng, args),
+                    f"load-{rng.randrange(args.clients)}", stats[endpoint],
+                ))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            next_at += rng.expovariate(args.rps) if args.arrivals == "poisson" else 1 / args.rps
+
+            now = time.perf_counter()
+            if now - last_progress >= 10:
+                last_progress = now
+                done = sum(sum(s.statuses.values()) for s in stats.values())
+                print(f"  {now - started:.0f}s: completed={done} in_flight={len(tasks)}", file=sys.stderr)
+
+        send_elapsed = time.perf_counter() - started
+        if tasks:
+            print(f"Waiting for {len(tasks)} in-flight requests...", file=sys.stderr)
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        service = await _service_snapshot(client)
+
+    total = EndpointStats()
+    for endpoint_stats in stats.values():
+        total.sent += endpoint_stats.sent
+        total.statuses.update(endpoint_stats.statuses)
+        total.latencies_ms.extend(endpoint_stats.latencies_ms)
+        total.error_latencies_ms.extend(endpoint_stats.error_latencies_ms)
+        total.prompt_tokens += endpoint_stats.prompt_tokens
+        total.completion_tokens += endpoint_stats.completion_tokens
+
+    summary = total.report(elapsed)
+    print(
+        f"  ok={summary['ok']}/{summary['sent']} throughput={summary['throughput_rps']}rps "
+        f"p50={(summary['latency_ms'] or {}).get('p50')}ms p99={(summary['latency_ms'] or {}).get('p99')}ms "
+        f"dropped={dropped}",
+        file=sys.stderr,
+    )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "url": args.url,
+            "endpoint": args.endpoint,
+            "target_rps": args.rps,
+            "arrivals": args.arrivals,
+            "duration": args.duration,
+            "clients": args.clients,
+            "repeat_ratio": args.repeat_ratio,
+            "max_in_flight": args.max_in_flight,
+            "seed": args.seed,
+        },
+        "offered_rps": round((total.sent + dropped) / send_elapsed, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "dropped": dropped,
+        "total": summary,
+        "endpoints": {endpoint: s.report(elapsed) for endpoint, s in stats.items()},
+        "service": service,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
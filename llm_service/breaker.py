@@ -0,0 +1,111 @@
+"""Circuit breaker for upstream LLM providers."""
+
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Provider skipped because its circuit is open; retry_after is a hint in seconds."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"Circuit for provider {name} is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker around one provider.
+
+    After failure_threshold consecutive failures the circuit opens and
+    calls fail fast for recovery_timeout seconds. Then it goes half-open
+    and lets up to half_open_probes calls through: a success closes the
+    circuit, a failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self._state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.opened_total = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            logger.info("Circuit for provider %s is half-open, probing", self.name)
+        return self._state
+
+    def available(self) -> bool:
+        """Whether a call would be let through right now (doesn't take a probe slot)."""
+        state = self.state
+        if state == OPEN:
+            return False
+        if state == HALF_OPEN:
+            return self._probes_in_flight < self.half_open_probes
+        return True
+
+    def retry_after(self) -> int:
+        """Seconds until the circuit goes half-open."""
+        if self._state != OPEN:
+            return 1
+        return max(1, math.ceil(self.recovery_timeout - (time.monotonic() - self._opened_at)))
+
+    def acquire(self) -> None:
+        """
+        Let a call through or fail fast.
+
+        Raises:
+            CircuitOpenError: Circuit is open or all half-open probes are taken
+        """
+        if not self.available():
+            raise CircuitOpenError(self.name, self.retry_after())
+        if self._state == HALF_OPEN:
+            self._probes_in_flight += 1
+
+    def release(self) -> None:
+        """Call ended without a verdict (cancelled, or a client-side error)."""
+        if self._state == HALF_OPEN and self._probes_in_flight:
+            self._probes_in_flight -= 1
+
+    def record_success(self) -> None:
+        if self._state != CLOSED:
+            logger.info("Circuit for provider %s closed", self.name)
+        self._state = CLOSED
+        self.consecutive_failures = 0
+        self._probes_in_flight = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self._state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.opened_total += 1
+                logger.warning(
+                    "Circuit for provider %s opened after %s consecutive failures",
+                    self.name, self.consecutive_failures,
+                )
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._probes_in_flight = 0
+
+    def snapshot(self) -> dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_total": self.opened_total,
+            "retry_after": self.retry_after() if state == OPEN else None,
+        }
@@ -0,0 +1,139 @@
+"""Two-tier response cache for completions: in-process LRU + optional shared Redis."""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis tier is optional
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+_REDIS_PREFIX = "llm:resp:"
+
+
+def cache_key(model: str, temperature: float, messages: list[dict[str, Any]]) -> str:
+    """
+    Canonical hash of a completion request.
+
+    Messages are normalised the same way the provider sends them (role,
+    content with surrounding whitespace stripped), so "text"/"content"
+    spelling and trailing newlines don't produce different keys.
+    """
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if content is None:
+            content = message.get("text", "")
+        normalized.append([str(message.get("role", "user")).strip().lower(), str(content).strip()])
+    canonical = json.dumps(
+        {"model": model, "temperature": round(float(temperature), 4), "messages": normalized},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Completion cache keyed by cache_key().
+
+    Memory tier: LRU bounded by total size of cached texts (bytes).
+    Redis tier: shared by replicas, enabled when redis_url is set;
+    Redis errors are logged and treated as misses.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int, redis_url: str | None = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expires_at, text, size)
+        self._entries: OrderedDict[str, tuple[float, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._redis = None
+        if redis_url:
+            if aioredis is None:
+                logger.warning("redis package is not installed, shared response cache disabled")
+            else:
+                self._redis = aioredis.from_url(redis_url)
+        self.hits_memory = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> str | None:
+        """Cached response text or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                return entry[1]
+            self._remove(key)
+
+        if self._redis is not None:
+            try:
+                value = await self._redis.get(_REDIS_PREFIX + key)
+            except Exception as e:
+                logger.warning("Response cache Redis get failed: %s", e)
+                value = None
+            if value is not None:
+                text = value.decode("utf-8")
+                self._put_memory(key, text)
+                self.hits_redis += 1
+                return text
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, text: str) -> None:
+        """Store a response in both tiers."""
+        self._put_memory(key, text)
+        self.stores += 1
+        if self._redis is not None:
+            try:
+                await self._redis.set(_REDIS_PREFIX + key, text.encode("utf-8"), ex=self.ttl)
+            except Exception as e:
+                logger.warning("Response cache Redis set failed: %s", e)
+
+    def _put_memory(self, key: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, text, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    async def aclose(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and memory tier size."""
+        lookups = self.hits_memory + self.hits_redis + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "redis_enabled": self._redis is not None,
+            "hits_memory": self.hits_memory,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits_memory + self.hits_redis) / lookups, 4) if lookups else 0.0,
+        }
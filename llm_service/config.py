@@ -7,8 +7,47 @@ class Settings(BaseSettings):
 
     # Gonka Proxy (OpenAI-compatible)
     gonka_base_url: str = "https://proxy.gonka.gg/v1"
-    gonka_api_key: SecretStr
+    gonka_api_key: SecretStr | None = None
     gonka_model: str = "Qwen/Qwen3-235B-A22B-Instruct-2507-FP8"
+    gonka_timeout: float = 120.0  # таймаут одной попытки, сек
+    gonka_deadline: float = 180.0  # общий лимит на запрос со всеми повторами, сек
+    gonka_max_retries: int = 3
+    gonka_backoff_base: float = 0.5
+    gonka_backoff_max: float = 8.0
+    gonka_max_connections: int = 50
+    gonka_max_keepalive_connections: int = 20
+
+    # YandexGPT (опционально, второй провайдер для роутера)
+    yandex_folder_id: str | None = None
+    yandex_api_key: SecretStr | None = None
+    yandex_model: str = "yandexgpt"
+
+    # Роутер провайдеров: порядок приоритета и хеджирование медленных запросов
+    llm_providers: str = "gonka"  # через запятую: gonka,yandex
+    hedge_enabled: bool = False
+    hedge_min_delay: float = 2.0  # сек, нижняя граница задержки перед хеджем
+    hedge_max_delay: float = 30.0  # сек, задержка, пока нет статистики p95
+    router_window: int = 100  # последних запросов в скользящей статистике
+
+    # Circuit breaker провайдера: открывается после N ошибок подряд
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: float = 30.0  # сек до пробного запроса
+    breaker_half_open_probes: int = 1
+
+    # Admission control: одновременные запросы к провайдеру и очередь ожидания
+    llm_max_concurrency: int = 8
+    llm_max_queue: int = 64
+    llm_queue_timeout: float = 60.0  # сек ожидания в очереди до отказа
+
+    # Кэш ответов: LRU в памяти + опционально общий Redis для реплик
+    cache_enabled: bool = True
+    cache_max_bytes: int = 64 * 1024 * 1024
+    cache_ttl: int = 24 * 60 * 60  # сек
+    cache_redis_url: str | None = None
+
+    # Пакетный анализ /analyze/batch
+    batch_max_items: int = 100
+    batch_concurrency: int = 4  # одновременно обрабатываемых снов одного пакета
     
     # Server
     host: str = "0.0.0.0"
@@ -1,12 +1,26 @@
 """LLM Service - Микросервис для анализа снов с помощью LLM"""
 
+import asyncio
+import json
 import logging
-from fastapi import FastAPI, HTTPException, status
-from pydantic import BaseModel, Field
+import time
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field, ValidationError
 
 from config import settings
 from providers.gonka_proxy import GonkaProxyProvider
+from router import ProviderRouter
+from breaker import CircuitOpenError
 from prompts import get_analysis_prompt, get_default_temperature, get_chat_system_prompt
+from scheduler import AdmissionScheduler, QueueFullError
+from cache import ResponseCache, cache_key
+from singleflight import SingleFlight
+from metrics import IN_FLIGHT, QUEUE_DEPTH, QUEUE_RUNNING, REQUEST_LATENCY
 
 # Настройка логирования
 logging.basicConfig(
@@ -15,18 +29,93 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _build_providers() -> dict:
+    """Провайдеры из LLM_PROVIDERS в порядке приоритета"""
+    providers = {}
+    for name in [n.strip() for n in settings.llm_providers.split(",") if n.strip()]:
+        if name == "gonka":
+            if settings.gonka_api_key is None:
+                raise ValueError("GONKA_API_KEY is required for the gonka provider")
+            providers[name] = GonkaProxyProvider(
+                base_url=settings.gonka_base_url,
+                api_key=settings.gonka_api_key.get_secret_value(),
+                model=settings.gonka_model,
+                timeout=settings.gonka_timeout,
+                deadline=settings.gonka_deadline,
+                max_retries=settings.gonka_max_retries,
+                backoff_base=settings.gonka_backoff_base,
+                backoff_max=settings.gonka_backoff_max,
+                max_connections=settings.gonka_max_connections,
+                max_keepalive_connections=settings.gonka_max_keepalive_connections,
+            )
+        elif name == "yandex":
+            if not settings.yandex_folder_id or settings.yandex_api_key is None:
+                raise ValueError("YANDEX_FOLDER_ID and YANDEX_API_KEY are required for the yandex provider")
+            # SDK нужен только при включённом провайдере
+            from providers.yandex import YandexGPTProvider
+            providers[name] = YandexGPTProvider(
+                folder_id=settings.yandex_folder_id,
+                api_key=settings.yandex_api_key.get_secret_value(),
+                model=settings.yandex_model,
+            )
+        else:
+            raise ValueError(f"Unknown LLM provider: {name}")
+    return providers
+
+
+# Инициализация провайдеров
+llm_provider = ProviderRouter(
+    _build_providers(),
+    hedge=settings.hedge_enabled,
+    hedge_min_delay=settings.hedge_min_delay,
+    hedge_max_delay=settings.hedge_max_delay,
+    window=settings.router_window,
+    failure_threshold=settings.breaker_failure_threshold,
+    recovery_timeout=settings.breaker_recovery_timeout,
+    half_open_probes=settings.breaker_half_open_probes,
+)
+logger.info(f"LLM providers: {', '.join(llm_provider.providers)}, hedging={settings.hedge_enabled}")
+
+# Ограничение одновременных запросов к провайдеру
+scheduler = AdmissionScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    max_queue=settings.llm_max_queue,
+    queue_timeout=settings.llm_queue_timeout,
+)
+
+QUEUE_DEPTH.set_function(lambda: scheduler.queued)
+QUEUE_RUNNING.set_function(lambda: scheduler.running)
+
+# Кэш ответов: повторные одинаковые запросы не генерируются заново
+response_cache = ResponseCache(
+    max_bytes=settings.cache_max_bytes,
+    ttl=settings.cache_ttl,
+    redis_url=settings.cache_redis_url,
+) if settings.cache_enabled else None
+
+# Одинаковые одновременные запросы делят один вызов провайдера
+inflight = SingleFlight()
+
+# Заголовок с ID клиента (пользователя) для справедливой очереди
+CLIENT_ID_HEADER = "X-Client-Id"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Закрытие пула соединений провайдера и кэша при остановке"""
+    yield
+    await llm_provider.aclose()
+    if response_cache is not None:
+        await response_cache.aclose()
+    logger.info("LLM provider connections closed")
+
+
 # Инициализация FastAPI
 app = FastAPI(
     title="JungAI LLM Service",
     description="Сервис для анализа снов с помощью нейросетей",
-    version="1.0.0"
-)
-
-# Инициализация провайдера
-llm_provider = GonkaProxyProvider(
-    base_url=settings.gonka_base_url,
-    api_key=settings.gonka_api_key.get_secret_value(),
-    model=settings.gonka_model,
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -37,9 +126,31 @@ class AnalyzeRequest(BaseModel):
     user_description: str | None = Field(None, max_length=1000, description="Описание пользователя (опционально)")
 
 
+class Usage(BaseModel):
+    """Токены, потраченные на запрос (0 — ответ из кэша или общего in-flight запроса)"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
 class AnalyzeResponse(BaseModel):
     """Ответ с результатом анализа"""
     result: str = Field(..., description="Результат анализа от нейросети")
+    usage: Usage = Field(default_factory=Usage, description="Потраченные токены")
+
+
+class BatchAnalyzeItem(AnalyzeRequest):
+    """Один сон пакета"""
+    id: str | None = Field(None, max_length=100, description="ID элемента, возвращается в результате")
+
+
+class BatchAnalyzeRequest(BaseModel):
+    """Запрос на пакетный анализ снов"""
+    # Элементы проверяются по одному в обработчике: невалидный сон получает
+    # свою строку с ошибкой, а не 422 на весь пакет
+    items: list[Any] = Field(
+        ..., min_length=1, max_length=settings.batch_max_items,
+        description="Сны для анализа: {id?, dream_text, user_description?}"
+    )
 
 
 class ChatMessage(BaseModel):
@@ -56,6 +167,24 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     """Ответ чата"""
     result: str = Field(..., description="Ответ от нейросети")
+    usage: Usage = Field(default_factory=Usage, description="Потраченные токены")
+
+
+class QueueStatsResponse(BaseModel):
+    """Состояние очереди запросов к провайдеру"""
+    running: int
+    queued: int
+    queued_clients: int
+    max_concurrency: int
+    max_queue: int
+    admitted_total: int
+    rejected_total: int
+    timed_out_total: int
+    avg_wait_seconds: float
+    avg_service_seconds: float
+    in_flight_keys: int
+    leaders_total: int
+    coalesced_total: int
 
 
 class HealthResponse(BaseModel):
@@ -63,20 +192,169 @@ class HealthResponse(BaseModel):
     status: str
     service: str
     version: str
+    providers: dict[str, str] = Field(default_factory=dict, description="Состояние circuit breaker провайдеров")
 
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Проверка здоровья сервиса"""
+    """
+    Проверка здоровья сервиса
+
+    status: ok — все circuit breaker закрыты, degraded — часть провайдеров
+    отключена, unavailable — запросы к LLM сейчас будут отклоняться.
+    """
+    circuits = llm_provider.circuit_states()
+    if all(state == "closed" for state in circuits.values()):
+        health = "ok"
+    elif any(breaker.available() for breaker in llm_provider.breakers.values()):
+        health = "degraded"
+    else:
+        health = "unavailable"
     return {
-        "status": "ok",
+        "status": health,
         "service": "llm_service",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "providers": circuits,
     }
 
 
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Латентность и число выполняемых запросов по эндпоинтам"""
+    endpoint = request.url.path
+    if endpoint == "/metrics":
+        return await call_next(request)
+    # Неизвестные пути в одну метку, чтобы сканеры не раздували число серий
+    if endpoint not in {route.path for route in app.routes}:
+        endpoint = "other"
+    started = time.monotonic()
+    status_code = 500
+    IN_FLIGHT.labels(endpoint=endpoint).inc()
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.labels(endpoint=endpoint).dec()
+        REQUEST_LATENCY.labels(endpoint=endpoint, status=str(status_code)).observe(time.monotonic() - started)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в формате Prometheus"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """Быстрый отказ при переполненной очереди с подсказкой, когда повторить"""
+    logger.warning(f"Request rejected by admission control: {exc.reason}, retry after {exc.retry_after}s")
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "LLM Service is busy", "reason": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    """Все провайдеры недоступны — быстрый отказ вместо ожидания таймаутов"""
+    logger.warning(f"Request rejected, no healthy provider: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "LLM providers are unavailable", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.get("/providers")
+async def providers_stats():
+    """Скользящая статистика провайдеров (лучший первым): латентность, ошибки, хеджи"""
+    return llm_provider.snapshot()
+
+
+@app.get("/queue", response_model=QueueStatsResponse)
+async def queue_stats():
+    """Текущая загрузка: выполняемые запросы, глубина очереди, счётчики"""
+    return {**scheduler.stats(), **inflight.stats()}
+
+
+async def _complete(messages: list[dict], temperature: float, client_id: str, usage: dict) -> str:
+    """
+    Ответ LLM с учётом кэша: при попадании провайдер и очередь не используются
+
+    Одинаковые запросы, пришедшие, пока первый ещё выполняется,
+    ждут его результата вместо повторного вызова провайдера.
+
+    Args:
+        messages: Сообщения [{role, content}, ...]
+        temperature: Температура генерации
+        client_id: ID клиента для очереди
+        usage: Сюда записываются токены; остаётся пустым, если провайдер
+            не вызывался для этого запроса (кэш или чужой in-flight вызов)
+
+    Returns:
+        Текст ответа
+    """
+    key = cache_key(llm_provider.model, temperature, messages)
+    if response_cache is not None:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            logger.info(f"Response cache hit: {key[:12]}")
+            return cached
+
+    async def call_provider() -> str:
+        async with scheduler.slot(client_id):
+            result = await llm_provider.chat_completion(
+                messages=messages, temperature=temperature, usage=usage
+            )
+        if response_cache is not None:
+            await response_cache.set(key, result)
+        return result
+
+    return await inflight.do(key, call_provider)
+
+
+class CacheStatsResponse(BaseModel):
+    """Состояние кэша ответов"""
+    enabled: bool
+    entries: int = 0
+    bytes: int = 0
+    max_bytes: int = 0
+    redis_enabled: bool = False
+    hits_memory: int = 0
+    hits_redis: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    hit_ratio: float = 0.0
+
+
+@app.get("/cache", response_model=CacheStatsResponse)
+async def cache_stats():
+    """Счётчики попаданий/промахов кэша ответов"""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+
+def _analysis_messages(request: AnalyzeRequest) -> list[dict]:
+    """Сообщения для LLM: системный промпт анализа и текст сна"""
+    system_prompt = get_analysis_prompt(
+        user_description=request.user_description,
+        dream_text=request.dream_text
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": request.dream_text},
+    ]
+
+
 @app.post("/analyze", response_model=AnalyzeResponse, status_code=status.HTTP_200_OK)
-async def analyze_dream(request: AnalyzeRequest):
+async def analyze_dream(
+    request: AnalyzeRequest,
+    client_id: str = Header("anonymous", alias=CLIENT_ID_HEADER),
+):
     """
     Анализ сна с помощью LLM
     
@@ -92,23 +370,15 @@ async def analyze_dream(request: AnalyzeRequest):
     try:
         logger.info("Received analysis request")
         
-        # Получаем промпт и temperature
-        system_prompt = get_analysis_prompt(
-            user_description=request.user_description,
-            dream_text=request.dream_text
-        )
-        temperature = get_default_temperature()
-        
-        # Вызываем LLM provider
-        result = await llm_provider.analyze_dream(
-            dream_text=request.dream_text,
-            system_prompt=system_prompt,
-            temperature=temperature
-        )
+        usage: dict = {}
+        result = await _complete(_analysis_messages(request), get_default_temperature(), client_id, usage)
         
         logger.info(f"Successfully analyzed dream, result length: {len(result)} chars")
         
-        return {"result": result}
+        return {"result": result, "usage": usage}
+    
+    except (QueueFullError, CircuitOpenError):
+        raise
     
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -125,8 +395,81 @@ async def analyze_dream(request: AnalyzeRequest):
         )
 
 
+@app.post("/analyze/batch")
+async def analyze_batch(
+    request: BatchAnalyzeRequest,
+    client_id: str = Header("anonymous", alias=CLIENT_ID_HEADER),
+):
+    """
+    Пакетный анализ снов с ограниченным параллелизмом
+
+    Одновременно выполняется не больше BATCH_CONCURRENCY снов пакета, все они
+    стоят в очереди под одним X-Client-Id, поэтому пакет не вытесняет
+    запросы других клиентов. Ответ — NDJSON, по строке на сон в порядке
+    готовности: {"index", "id", "result", "usage"} или {"index", "id",
+    "error", "status"}. Ошибка одного сна не прерывает остальные.
+    """
+    logger.info(f"Received batch analysis request with {len(request.items)} items")
+
+    # Отказ 429 возможен только до начала ответа
+    scheduler.check_capacity()
+
+    temperature = get_default_temperature()
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def analyze_item(index: int, raw: Any) -> dict:
+        raw_id = raw.get("id") if isinstance(raw, dict) else None
+        line = {"index": index, "id": raw_id if isinstance(raw_id, str) else None}
+        try:
+            item = BatchAnalyzeItem.model_validate(raw)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+                for err in e.errors()
+            )
+            return {**line, "error": errors, "status": 422}
+
+        async with semaphore:
+            usage: dict = {}
+            try:
+                result = await _complete(_analysis_messages(item), temperature, client_id, usage)
+                return {**line, "result": result, "usage": Usage(**usage).model_dump()}
+            except QueueFullError as e:
+                return {**line, "error": "LLM Service is busy", "status": 429, "retry_after": e.retry_after}
+            except CircuitOpenError as e:
+                return {**line, "error": "LLM providers are unavailable", "status": 503, "retry_after": e.retry_after}
+            except ValueError as e:
+                return {**line, "error": str(e), "status": 400}
+            except Exception as e:
+                logger.error(f"Error analyzing batch item {index}: {e}", exc_info=True)
+                return {**line, "error": "Failed to analyze dream. Please try again later.", "status": 500}
+
+    async def lines():
+        tasks = [asyncio.create_task(analyze_item(i, item)) for i, item in enumerate(request.items)]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                failed += "error" in line
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            logger.info(f"Batch analysis finished: {len(tasks) - failed} ok, {failed} failed")
+        finally:
+            # Клиент отключился — не тратим провайдера на оставшиеся сны
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/chat", response_model=ChatResponse, status_code=status.HTTP_200_OK)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    client_id: str = Header("anonymous", alias=CLIENT_ID_HEADER),
+):
     """
     Мульти-тёрн чат с контекстом всех снов.
 
@@ -138,13 +481,14 @@ async def chat(request: ChatRequest):
 
         messages = [{"role": m.role, "content": m.text} for m in request.messages]
 
-        result = await llm_provider.chat_completion(
-            messages=messages,
-            temperature=get_default_temperature(),
-        )
+        usage: dict = {}
+        result = await _complete(messages, get_default_temperature(), client_id, usage)
 
         logger.info(f"Chat response length: {len(result)} chars")
-        return {"result": result}
+        return {"result": result, "usage": usage}
+
+    except (QueueFullError, CircuitOpenError):
+        raise
 
     except ValueError as e:
         logger.error(f"Validation error in chat: {e}")
@@ -161,6 +505,87 @@ async def chat(request: ChatRequest):
         )
 
 
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    client_id: str = Header("anonymous", alias=CLIENT_ID_HEADER),
+):
+    """
+    Мульти-тёрн чат в режиме стриминга (Server-Sent Events).
+
+    События: data: {"delta": "..."} по мере генерации,
+    затем data: {"done": true, "usage": {...}} или data: {"error": "..."}.
+    """
+    logger.info(f"Received chat stream request with {len(request.messages)} messages")
+
+    messages = [{"role": m.role, "content": m.text} for m in request.messages]
+
+    # Отказ 429 возможен только до начала стрима; дальше ждём слот в очереди
+    scheduler.check_capacity()
+
+    temperature = get_default_temperature()
+    key = cache_key(llm_provider.model, temperature, messages)
+
+    async def event_stream():
+        if response_cache is not None:
+            cached = await response_cache.get(key)
+            if cached is not None:
+                logger.info(f"Response cache hit (stream): {key[:12]}")
+                yield _sse({"delta": cached})
+                yield _sse({"done": True, "usage": Usage().model_dump()})
+                return
+
+        # Тот же запрос уже генерируется через /chat или /analyze — ждём его
+        flight = inflight.in_flight(key)
+        if flight is not None:
+            try:
+                result = await asyncio.shield(flight)
+            except Exception as e:
+                logger.error(f"Coalesced chat stream failed: {e}")
+                yield _sse({"error": "Failed to process chat request. Please try again later."})
+                return
+            yield _sse({"delta": result})
+            yield _sse({"done": True, "usage": Usage().model_dump()})
+            return
+
+        parts: list[str] = []
+        usage: dict = {}
+        try:
+            async with scheduler.slot(client_id):
+                async for delta in llm_provider.chat_completion_stream(
+                    messages=messages,
+                    temperature=temperature,
+                    usage=usage,
+                ):
+                    parts.append(delta)
+                    yield _sse({"delta": delta})
+            result = "".join(parts).strip()
+            logger.info(f"Chat stream finished, length: {len(result)} chars")
+            if response_cache is not None:
+                await response_cache.set(key, result)
+            yield _sse({"done": True, "usage": Usage(**usage).model_dump()})
+        except QueueFullError as e:
+            logger.warning(f"Chat stream rejected by admission control: {e.reason}")
+            yield _sse({"error": "LLM Service is busy", "retry_after": e.retry_after})
+        except CircuitOpenError as e:
+            logger.warning(f"Chat stream rejected, no healthy provider: {e}")
+            yield _sse({"error": "LLM providers are unavailable", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error during chat stream: {e}", exc_info=True)
+            yield _sse({"error": "Failed to process chat request. Please try again later."})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(data: dict) -> str:
+    """Одно событие Server-Sent Events"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,56 @@
+"""Prometheus metrics of llm_service."""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# LLM calls take from under a second to minutes
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 180, 300)
+
+REQUEST_LATENCY = Histogram(
+    "llm_http_request_duration_seconds",
+    "Time to produce the HTTP response (for streams: until headers are sent)",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "llm_http_requests_in_flight",
+    "HTTP requests being handled",
+    ["endpoint"],
+)
+PROVIDER_LATENCY = Histogram(
+    "llm_provider_request_duration_seconds",
+    "Full provider call duration, including the provider's own retries",
+    ["provider", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+PROVIDER_TTFB = Histogram(
+    "llm_provider_ttfb_seconds",
+    "Time from sending a request upstream to receiving response headers",
+    ["provider"],
+    buckets=LATENCY_BUCKETS,
+)
+PROVIDER_RETRIES = Counter(
+    "llm_provider_retries_total",
+    "Upstream attempts that were retried, by status code or error type",
+    ["provider", "status"],
+)
+TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported in the provider's usage field",
+    ["provider", "type"],
+)
+QUEUE_DEPTH = Gauge(
+    "llm_queue_depth",
+    "Requests waiting for an admission slot",
+)
+QUEUE_RUNNING = Gauge(
+    "llm_queue_running",
+    "Requests holding an admission slot",
+)
+
+
+def record_usage(provider: str, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+    """Count tokens from a provider usage report (missing fields are skipped)."""
+    if prompt_tokens:
+        TOKENS.labels(provider=provider, type="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        TOKENS.labels(provider=provider, type="completion").inc(completion_tokens)
@@ -1,3 +1,32 @@
+# Буквы, встречающиеся только в украинском алфавите
+_UKRAINIAN_LETTERS = set("іїєґІЇЄҐ")
+
+
+def detect_language(text: str) -> str:
+    """
+    Определить язык текста сна по алфавиту
+
+    Грубая эвристика без внешних зависимостей: достаточно, чтобы
+    закрепить в промпте язык ответа.
+
+    Returns:
+        Название языка на английском (для инструкции модели)
+    """
+    cyrillic = latin = 0
+    for char in text:
+        if "\u0400" <= char <= "\u04ff":
+            cyrillic += 1
+        elif char.isascii() and char.isalpha():
+            latin += 1
+    if cyrillic >= latin and cyrillic:
+        if any(char in _UKRAINIAN_LETTERS for char in text):
+            return "Ukrainian"
+        return "Russian"
+    if latin:
+        return "English"
+    return "the same language as the dream text"
+
+
 def get_analysis_prompt(
     user_description: str | None = None,
     dream_text: str | None = None
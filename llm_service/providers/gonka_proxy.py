@@ -1,13 +1,28 @@
 """Provider for Gonka Proxy (OpenAI-compatible API)."""
 
 import asyncio
+import json
 import logging
-from typing import Any
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator
 
 import httpx
 
+from metrics import PROVIDER_RETRIES, PROVIDER_TTFB, record_usage
+
 logger = logging.getLogger(__name__)
 
+# Provider label in metrics
+METRICS_LABEL = "gonka"
+
+# Statuses worth another attempt; other 4xx/5xx fail immediately
+RETRYABLE_STATUSES = {408, 429, 502, 503, 504}
+# Don't start an attempt with less time than this left before the deadline
+MIN_ATTEMPT_SECONDS = 1.0
+
 
 class GonkaProxyProvider:
     """Provider for chat completions via Gonka Proxy."""
@@ -18,11 +33,38 @@ class GonkaProxyProvider:
         model: str,
         base_url: str = "https://proxy.gonka.gg/v1",
         timeout: float = 120.0,
+        deadline: float = 180.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_connections: int = 50,
+        max_keepalive_connections: int = 20,
     ):
         self.api_key = api_key
         self.model = model
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._client: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Shared pooled client, created lazily inside the running event loop."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the pooled client and its connections."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
 
     async def analyze_dream(
         self,
@@ -41,8 +83,9 @@ class GonkaProxyProvider:
         self,
         messages: list[dict],
         temperature: float = 0.7,
+        usage: dict | None = None,
     ) -> str:
-        """Multi-turn chat completion."""
+        """Multi-turn chat completion; token usage is written into `usage` if given."""
         normalized_messages = [self._normalize_message(m) for m in messages]
         payload = {
             "model": self.model,
@@ -62,47 +105,37 @@ class GonkaProxyProvider:
             temperature,
         )
 
-        _retryable = {502, 503, 504}
-        _max_retries = 3
-        _retry_delay = 5.0
-
-        last_exc: Exception | None = None
-        for attempt in range(1, _max_retries + 1):
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(url, json=payload, headers=headers)
-                    response.raise_for_status()
-                    data = response.json()
-                    break
-            except httpx.HTTPStatusError as e:
-                last_exc = e
-                if e.response.status_code in _retryable and attempt < _max_retries:
-                    logger.warning(
-                        "Gonka Proxy %s on attempt %s/%s, retrying in %.0fs...",
-                        e.response.status_code, attempt, _max_retries, _retry_delay,
-                    )
-                    await asyncio.sleep(_retry_delay)
-                    continue
-                logger.error(
-                    "Gonka Proxy HTTP error: status=%s body=%s",
-                    e.response.status_code,
-                    e.response.text[:200],
+                sent_at = time.monotonic()
+                async with self._get_client().stream(
+                    "POST",
+                    url,
+                    json=payload,
+                    headers=headers,
+                    timeout=self._attempt_timeout(deadline),
+                ) as response:
+                    PROVIDER_TTFB.labels(provider=METRICS_LABEL).observe(time.monotonic() - sent_at)
+                    await response.aread()
+                response.raise_for_status()
+                data = response.json()
+                break
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    self._log_failure(e)
+                    raise
+                PROVIDER_RETRIES.labels(provider=METRICS_LABEL, status=self._describe(e)).inc()
+                logger.warning(
+                    "Gonka Proxy %s on attempt %s/%s, retrying in %.2fs...",
+                    self._describe(e), attempt, self.max_retries, delay,
                 )
-                raise
-            except Exception as e:
-                last_exc = e
-                if attempt < _max_retries:
-                    logger.warning(
-                        "Gonka Proxy request failed on attempt %s/%s: %s, retrying...",
-                        attempt, _max_retries, e,
-                    )
-                    await asyncio.sleep(_retry_delay)
-                    continue
-                logger.error("Gonka Proxy request failed: %s", e)
-                raise
-        else:
-            raise last_exc
+                await asyncio.sleep(delay)
 
+        self._record_usage(data, usage)
         content = self._extract_content(data)
         if not content:
             logger.error("Empty response content from Gonka Proxy")
@@ -110,15 +143,176 @@ class GonkaProxyProvider:
 
         return content
 
+    async def chat_completion_stream(
+        self,
+        messages: list[dict],
+        temperature: float = 0.7,
+        usage: dict | None = None,
+    ) -> AsyncIterator[str]:
+        """Multi-turn chat completion in streaming mode, yields content deltas.
+
+        Token usage from the final chunk is written into `usage` if given.
+        """
+        normalized_messages = [self._normalize_message(m) for m in messages]
+        payload = {
+            "model": self.model,
+            "messages": normalized_messages,
+            "temperature": temperature,
+            "stream": True,
+            # Final chunk carries usage (prompt/completion tokens)
+            "stream_options": {"include_usage": True},
+        }
+        url = f"{self.base_url}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+        }
+
+        logger.info(
+            "Requesting Gonka Proxy stream: model=%s, messages=%s, temperature=%s",
+            self.model,
+            len(normalized_messages),
+            temperature,
+        )
+
+        deadline = time.monotonic() + self.deadline
+        received = 0
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                sent_at = time.monotonic()
+                async with self._get_client().stream(
+                    "POST",
+                    url,
+                    json=payload,
+                    headers=headers,
+                    timeout=self._attempt_timeout(deadline),
+                ) as response:
+                    PROVIDER_TTFB.labels(provider=METRICS_LABEL).observe(time.monotonic() - sent_at)
+                    if response.is_error:
+                        await response.aread()
+                        response.raise_for_status()
+
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            logger.warning("Malformed stream chunk from Gonka Proxy: %s", data[:200])
+                            continue
+                        if chunk.get("usage"):
+                            self._record_usage(chunk, usage)
+                        delta = self._extract_delta(chunk)
+                        if delta:
+                            received += len(delta)
+                            yield delta
+                break
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                # Once deltas reached the caller the stream can't be replayed
+                delay = None if received else self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    self._log_failure(e)
+                    raise
+                PROVIDER_RETRIES.labels(provider=METRICS_LABEL, status=self._describe(e)).inc()
+                logger.warning(
+                    "Gonka Proxy stream %s on attempt %s/%s, retrying in %.2fs...",
+                    self._describe(e), attempt, self.max_retries, delay,
+                )
+                await asyncio.sleep(delay)
+
+        if not received:
+            logger.error("Empty stream from Gonka Proxy")
+            raise ValueError("Empty response from Gonka Proxy")
+
     async def health_check(self) -> bool:
         url = f"{self.base_url}/health"
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url)
-                return response.status_code == 200
+            response = await self._get_client().get(url, timeout=10.0)
+            return response.status_code == 200
         except Exception:
             return False
 
+    def _attempt_timeout(self, deadline: float) -> float:
+        """Per-attempt timeout: the regular one, capped by the time left."""
+        return max(MIN_ATTEMPT_SECONDS, min(self.timeout, deadline - time.monotonic()))
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> float | None:
+        """
+        Delay before the next attempt, or None if the error must be raised.
+
+        Exponential backoff with full jitter, so callers hit by the same
+        failure wave don't retry in lockstep. A Retry-After from the proxy
+        takes precedence. No retry if it wouldn't fit before the deadline.
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        retry_after = None
+        if isinstance(error, httpx.HTTPStatusError):
+            if error.response.status_code not in RETRYABLE_STATUSES:
+                return None
+            retry_after = self._parse_retry_after(error.response.headers.get("Retry-After"))
+
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+        if time.monotonic() + delay + MIN_ATTEMPT_SECONDS > deadline:
+            return None
+        return delay
+
+    @staticmethod
+    def _parse_retry_after(value: str | None) -> float | None:
+        """Retry-After as seconds (delta-seconds or HTTP-date)."""
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    @staticmethod
+    def _describe(error: Exception) -> str:
+        if isinstance(error, httpx.HTTPStatusError):
+            return str(error.response.status_code)
+        return type(error).__name__
+
+    @staticmethod
+    def _log_failure(error: Exception) -> None:
+        if isinstance(error, httpx.HTTPStatusError):
+            logger.error(
+                "Gonka Proxy HTTP error: status=%s body=%s",
+                error.response.status_code,
+                error.response.text[:200],
+            )
+        else:
+            logger.error("Gonka Proxy request failed: %s", error)
+
+    @staticmethod
+    def _record_usage(payload: dict[str, Any], usage: dict | None) -> None:
+        reported = payload.get("usage")
+        if not isinstance(reported, dict):
+            return
+        prompt_tokens = reported.get("prompt_tokens") or 0
+        completion_tokens = reported.get("completion_tokens") or 0
+        record_usage(METRICS_LABEL, prompt_tokens, completion_tokens)
+        if usage is not None:
+            usage["prompt_tokens"] = prompt_tokens
+            usage["completion_tokens"] = completion_tokens
+
     @staticmethod
     def _normalize_message(message: dict[str, Any]) -> dict[str, str]:
         role = str(message.get("role", "user"))
@@ -147,3 +341,14 @@ class GonkaProxyProvider:
                         parts.append(text)
             return "".join(parts).strip()
         return ""
+
+    @staticmethod
+    def _extract_delta(payload: dict[str, Any]) -> str:
+        choices = payload.get("choices")
+        if not isinstance(choices, list) or not choices:
+            return ""
+        delta = choices[0].get("delta") if isinstance(choices[0], dict) else None
+        if not isinstance(delta, dict):
+            return ""
+        content = delta.get("content")
+        return content if isinstance(content, str) else ""
@@ -1,7 +1,9 @@
 """Провайдер для YandexGPT"""
 
 import logging
-from yandex_cloud_ml_sdk import YCloudML
+from yandex_cloud_ml_sdk import AsyncYCloudML
+
+from metrics import record_usage
 
 logger = logging.getLogger(__name__)
 
@@ -9,20 +11,33 @@ logger = logging.getLogger(__name__)
 class YandexGPTProvider:
     """Провайдер для работы с YandexGPT"""
     
-    def __init__(self, folder_id: str, api_key: str):
+    def __init__(self, folder_id: str, api_key: str, model: str = "yandexgpt"):
         """
         Инициализация провайдера
         
         Args:
             folder_id: Folder ID из Yandex Cloud
             api_key: API ключ
+            model: Имя модели YandexGPT
         """
         self.folder_id = folder_id
         self.api_key = api_key
-        self.sdk = YCloudML(
+        self.model = model
+        # Один асинхронный клиент SDK на процесс: вызовы не блокируют event loop
+        self.sdk = AsyncYCloudML(
             folder_id=folder_id,
             auth=api_key,
         )
+        # Сконфигурированные модели по temperature (configure() создаёт новый объект)
+        self._models: dict[float, object] = {}
+
+    def _completions(self, temperature: float):
+        """Хэндл модели с заданной temperature, переиспользуется между запросами"""
+        model = self._models.get(temperature)
+        if model is None:
+            model = self.sdk.models.completions(self.model).configure(temperature=temperature)
+            self._models[temperature] = model
+        return model
     
     async def analyze_dream(
         self,
@@ -45,62 +60,51 @@ class YandexGPTProvider:
             Exception: При ошибке вызова API
         """
         messages = [
-            {
-                "role": "system",
-                "text": system_prompt
-            },
-            {
-                "role": "user",
-                "text": dream_text
-            }
+            {"role": "system", "text": system_prompt},
+            {"role": "user", "text": dream_text},
         ]
         
-        logger.info(f"Requesting YandexGPT with temperature={temperature}")
         logger.debug(f"System prompt: {system_prompt[:100]}...")
         logger.debug(f"Dream text length: {len(dream_text)} chars")
         
-        try:
-            result = (
-                self.sdk.models.completions("yandexgpt")
-                .configure(temperature=temperature)
-                .run(messages)
-            )
-            
-            # Возвращаем первый вариант ответа
-            if result and len(result) > 0:
-                logger.info("Successfully received response from YandexGPT")
-                return result[0].text if hasattr(result[0], 'text') else str(result[0])
-            else:
-                logger.error("Empty response from YandexGPT")
-                raise ValueError("Empty response from YandexGPT")
-        
-        except Exception as e:
-            logger.error(f"Error calling YandexGPT: {e}")
-            raise
+        return await self.chat_completion(messages=messages, temperature=temperature)
 
     async def chat_completion(
         self,
         messages: list[dict],
         temperature: float = 0.7,
+        usage: dict | None = None,
     ) -> str:
         """
         Мульти-тёрн чат через YandexGPT.
 
         Args:
-            messages: Список сообщений [{role, text}, ...]
+            messages: Список сообщений [{role, text}] или [{role, content}]
             temperature: Temperature для генерации
+            usage: Словарь, куда записываются prompt_tokens/completion_tokens (опционально)
 
         Returns:
             Текст ответа от нейросети
         """
         logger.info(f"Requesting YandexGPT chat with {len(messages)} messages, temperature={temperature}")
 
+        # SDK ждёт {role, text}; роутер передаёт сообщения в формате OpenAI {role, content}
+        messages = [
+            {"role": m.get("role", "user"), "text": m["text"] if "text" in m else m.get("content", "")}
+            for m in messages
+        ]
+
         try:
-            result = (
-                self.sdk.models.completions("yandexgpt")
-                .configure(temperature=temperature)
-                .run(messages)
-            )
+            result = await self._completions(temperature).run(messages)
+
+            reported = getattr(result, "usage", None)
+            if reported is not None:
+                prompt_tokens = int(getattr(reported, "input_text_tokens", 0) or 0)
+                completion_tokens = int(getattr(reported, "completion_tokens", 0) or 0)
+                record_usage("yandex", prompt_tokens, completion_tokens)
+                if usage is not None:
+                    usage["prompt_tokens"] = prompt_tokens
+                    usage["completion_tokens"] = completion_tokens
 
             if result and len(result) > 0:
                 logger.info("Successfully received chat response from YandexGPT")
@@ -0,0 +1,296 @@
+"""Latency-aware routing across LLM providers with optional hedged requests."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+
+from breaker import CircuitBreaker, CircuitOpenError
+from metrics import PROVIDER_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Latency assumed for a provider with no successful samples yet, seconds
+DEFAULT_LATENCY = 10.0
+# How much a 100% error rate inflates a provider's score
+ERROR_PENALTY = 4.0
+# Samples needed before the provider's own p95 is trusted as hedge delay
+MIN_SAMPLES_FOR_P95 = 5
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Whether an error says the provider is unhealthy (not that our request was bad)."""
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is None:
+        return True
+    return status_code >= 500 or status_code in (408, 429)
+
+
+class ProviderStats:
+    """Rolling latency and error statistics of one provider."""
+
+    def __init__(self, window: int):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.requests_total = 0
+        self.errors_total = 0
+        self.hedges_total = 0
+        self.hedge_wins_total = 0
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.requests_total += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors_total += 1
+
+    def percentile(self, q: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self) -> float:
+        """Lower is better: median latency inflated by the error rate."""
+        p50 = self.percentile(0.5)
+        latency = p50 if p50 is not None else DEFAULT_LATENCY
+        return latency * (1 + ERROR_PENALTY * self.error_rate())
+
+    def snapshot(self) -> dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "samples": len(self.outcomes),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 4),
+            "score": round(self.score(), 3),
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "hedges_total": self.hedges_total,
+            "hedge_wins_total": self.hedge_wins_total,
+        }
+
+
+class ProviderRouter:
+    """
+    Routes completions to the provider with the best rolling score.
+
+    Each provider sits behind a circuit breaker: while it is open the
+    provider is ranked last and calls to it fail fast. On failure the
+    request falls over to the next provider. With hedging
+    enabled, if the chosen provider hasn't answered within its p95 latency
+    (clamped to [hedge_min_delay, hedge_max_delay]), the same request is
+    sent to the next provider and the first successful answer wins.
+    """
+
+    def __init__(
+        self,
+        providers: dict[str, Any],
+        hedge: bool = False,
+        hedge_min_delay: float = 2.0,
+        hedge_max_delay: float = 30.0,
+        window: int = 100,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_probes: int = 1,
+    ):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.stats = {name: ProviderStats(window) for name in providers}
+        self.breakers = {
+            name: CircuitBreaker(name, failure_threshold, recovery_timeout, half_open_probes)
+            for name in providers
+        }
+        # Part of the response cache key: answers depend on the provider set
+        self.model = "|".join(f"{name}:{p.model}" for name, p in providers.items())
+
+    def ranked(self) -> list[str]:
+        """Provider names, best first; open circuits last, configuration order breaks ties."""
+        order = list(self.providers)
+        return sorted(order, key=lambda name: (
+            not self.breakers[name].available(),
+            self.stats[name].score(),
+            order.index(name),
+        ))
+
+    def _hedge_delay(self, name: str) -> float:
+        stats = self.stats[name]
+        p95 = stats.percentile(0.95) if len(stats.latencies) >= MIN_SAMPLES_FOR_P95 else None
+        delay = p95 if p95 is not None else self.hedge_max_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+
+    async def _call(self, name: str, messages: list[dict], temperature: float, usage: dict | None) -> str:
+        breaker = self.breakers[name]
+        breaker.acquire()
+        started = time.monotonic()
+        try:
+            result = await self.providers[name].chat_completion(
+                messages=messages, temperature=temperature, usage=usage
+            )
+        except asyncio.CancelledError:
+            # Lost a hedge race — not the provider's fault
+            breaker.release()
+            PROVIDER_LATENCY.labels(provider=name, outcome="cancelled").observe(time.monotonic() - started)
+            raise
+        except Exception as e:
+            self._record_failure(name, e, time.monotonic() - started)
+            raise
+        self._record_success(name, time.monotonic() - started)
+        return result
+
+    def _record_success(self, name: str, elapsed: float) -> None:
+        self.stats[name].record(elapsed, ok=True)
+        self.breakers[name].record_success()
+        PROVIDER_LATENCY.labels(provider=name, outcome="success").observe(elapsed)
+
+    def _record_failure(self, name: str, error: Exception, elapsed: float) -> None:
+        PROVIDER_LATENCY.labels(provider=name, outcome="error").observe(elapsed)
+        if is_upstream_failure(error):
+            self.stats[name].record(elapsed, ok=False)
+            self.breakers[name].record_failure()
+        else:
+            self.breakers[name].release()
+
+    async def analyze_dream(self, dream_text: str, system_prompt: str, temperature: float = 0.7) -> str:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": dream_text},
+        ]
+        return await self.chat_completion(messages=messages, temperature=temperature)
+
+    async def chat_completion(
+        self, messages: list[dict], temperature: float = 0.7, usage: dict | None = None
+    ) -> str:
+        """Completion from the best provider, with failover and optional hedging.
+
+        Token usage of the winning call is written into `usage` if given.
+        """
+        order = self.ranked()
+        if self.hedge and len(order) > 1:
+            return await self._hedged(order, messages, temperature, usage)
+
+        last_error: Exception | None = None
+        for name in order:
+            try:
+                return await self._call(name, messages, temperature, usage)
+            except CircuitOpenError as e:
+                last_error = e
+            except Exception as e:
+                last_error = e
+                logger.warning("Provider %s failed, trying next: %s", name, e)
+        raise last_error
+
+    async def _hedged(
+        self, order: list[str], messages: list[dict], temperature: float, usage: dict | None
+    ) -> str:
+        # Each attempt reports usage into its own dict; only the winner's is kept
+        pending: dict[asyncio.Task, tuple[str, dict]] = {}
+
+        def start(name: str) -> None:
+            attempt_usage: dict = {}
+            task = asyncio.create_task(self._call(name, messages, temperature, attempt_usage))
+            pending[task] = (name, attempt_usage)
+
+        primary = order[0]
+        start(primary)
+        backups = iter(order[1:])
+        hedged: set[str] = set()
+        hedge_delay = self._hedge_delay(primary)
+        deadline = time.monotonic() + hedge_delay
+        last_error: Exception | None = None
+
+        try:
+            while pending:
+                timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is slower than its p95 — fire the hedge
+                    backup = next(backups, None)
+                    deadline = None
+                    if backup is not None:
+                        logger.info("Hedging request to %s after %.1fs on %s", backup, hedge_delay, primary)
+                        self.stats[backup].hedges_total += 1
+                        hedged.add(backup)
+                        start(backup)
+                    continue
+
+                for task in done:
+                    name, attempt_usage = pending.pop(task)
+                    if task.exception() is None:
+                        if name in hedged:
+                            self.stats[name].hedge_wins_total += 1
+                        if usage is not None:
+                            usage.update(attempt_usage)
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning("Provider %s failed: %s", name, last_error)
+
+                # A call failed — fail over immediately if nothing else is running
+                if not pending:
+                    backup = next(backups, None)
+                    if backup is not None:
+                        deadline = None
+                        start(backup)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def chat_completion_stream(
+        self, messages: list[dict], temperature: float = 0.7, usage: dict | None = None
+    ) -> AsyncIterator[str]:
+        """Stream from the best provider that supports streaming (no hedging)."""
+        name = next(
+            (n for n in self.ranked() if hasattr(self.providers[n], "chat_completion_stream")),
+            None,
+        )
+        if name is None:
+            raise ValueError("No configured provider supports streaming")
+
+        breaker = self.breakers[name]
+        breaker.acquire()
+        started = time.monotonic()
+        try:
+            async for delta in self.providers[name].chat_completion_stream(
+                messages=messages, temperature=temperature, usage=usage
+            ):
+                yield delta
+        except Exception as e:
+            self._record_failure(name, e, time.monotonic() - started)
+            raise
+        except BaseException:
+            # Client went away mid-stream
+            breaker.release()
+            raise
+        self._record_success(name, time.monotonic() - started)
+
+    async def aclose(self) -> None:
+        for provider in self.providers.values():
+            if hasattr(provider, "aclose"):
+                await provider.aclose()
+
+    def circuit_states(self) -> dict[str, str]:
+        """Circuit state of each provider."""
+        return {name: breaker.state for name, breaker in self.breakers.items()}
+
+    def snapshot(self) -> dict:
+        """Per-provider routing statistics and circuit state, best first."""
+        return {
+            name: {**self.stats[name].snapshot(), "circuit": self.breakers[name].snapshot()}
+            for name in self.ranked()
+        }
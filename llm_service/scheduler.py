@@ -0,0 +1,151 @@
+"""Admission control: concurrency cap, bounded queue, per-client fair scheduling."""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest request in the moving average of service time
+_EWMA_ALPHA = 0.2
+
+
+class QueueFullError(Exception):
+    """Request rejected by admission control; retry_after is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionScheduler:
+    """
+    Bounded in-process scheduler for upstream LLM calls.
+
+    At most max_concurrency requests run at once; up to max_queue wait.
+    Waiters are kept in per-client FIFO queues and slots are handed out
+    round-robin across clients, so one client's burst can't starve others.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        initial_service_time: float = 10.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.queued = 0
+        # client -> FIFO of waiters; order of keys is the round-robin order
+        self._waiters: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self._service_time = initial_service_time
+        self._wait_time = 0.0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.timed_out_total = 0
+
+    def retry_after(self) -> int:
+        """Rough time until a newly queued request would start, in seconds."""
+        backlog = self.queued + self.running + 1
+        return max(1, math.ceil(backlog / self.max_concurrency * self._service_time))
+
+    def check_capacity(self) -> None:
+        """Fail fast when the queue is full (used before a stream starts)."""
+        if self.running >= self.max_concurrency and self.queued >= self.max_queue:
+            self.rejected_total += 1
+            raise QueueFullError("queue_full", self.retry_after())
+
+    async def _acquire(self, client: str) -> None:
+        if self.running < self.max_concurrency and not self.queued:
+            self.running += 1
+            return
+
+        self.check_capacity()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._discard(client, future):
+                self.timed_out_total += 1
+                raise QueueFullError("queue_timeout", self.retry_after())
+            # Slot was handed over right at the timeout
+        except asyncio.CancelledError:
+            if not self._discard(client, future):
+                # Slot was already handed over — pass it on
+                self._release()
+            raise
+
+    def _discard(self, client: str, future: asyncio.Future) -> bool:
+        """Drop a waiter that gave up. False if it already got a slot."""
+        if future.done():
+            return False
+        waiters = self._waiters.get(client)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[client]
+        self.queued -= 1
+        future.cancel()
+        return True
+
+    def _release(self) -> None:
+        # Next client in round-robin order gets the slot, then goes to the back
+        while self._waiters:
+            client, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiters.move_to_end(client)
+            else:
+                del self._waiters[client]
+            if future.done():
+                continue
+            self.queued -= 1
+            future.set_result(None)
+            return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, client: str) -> AsyncIterator[None]:
+        """
+        Hold a slot for one upstream call.
+
+        Raises:
+            QueueFullError: Queue is full or waiting exceeded queue_timeout
+        """
+        enqueued_at = time.monotonic()
+        await self._acquire(client)
+        started_at = time.monotonic()
+        self.admitted_total += 1
+        self._wait_time += started_at - enqueued_at
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started_at
+            self._service_time += _EWMA_ALPHA * (elapsed - self._service_time)
+            self._release()
+
+    def stats(self) -> dict:
+        """Live queue metrics."""
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "queued_clients": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "timed_out_total": self.timed_out_total,
+            "avg_wait_seconds": round(self._wait_time / self.admitted_total, 3) if self.admitted_total else 0.0,
+            "avg_service_seconds": round(self._service_time, 3),
+        }
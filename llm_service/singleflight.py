@@ -0,0 +1,56 @@
+"""Single-flight: concurrent identical requests share one upstream call."""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key.
+
+    The first caller (leader) starts the call as a separate task; callers
+    arriving while it runs await the same task and get its result or its
+    exception. The task is shielded, so a disconnecting caller doesn't
+    cancel the work the others are waiting for.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, asyncio.Task] = {}
+        self.leaders_total = 0
+        self.coalesced_total = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() once per key at a time and share the outcome."""
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.leaders_total += 1
+        else:
+            self.coalesced_total += 1
+            logger.info("Coalesced request into in-flight call %s", key[:12])
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: str) -> asyncio.Task | None:
+        """Running call for key, if any."""
+        return self._flights.get(key)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Mark the exception retrieved if every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight_keys": len(self._flights),
+            "leaders_total": self.leaders_total,
+            "coalesced_total": self.coalesced_total,
+        }